@@ -0,0 +1,40 @@
+"""Clientes de AWS perezosos para reducir el arranque en frío.
+
+``boto3`` tarda en importarse y crear un cliente cuesta más todavía, así que
+``LazyClient`` aplaza las dos cosas hasta la primera llamada. Se comparte
+entre Parcial1 y Parcial2 (enlace simbólico).
+"""
+import threading
+
+
+class LazyClient:
+    """Proxy de un cliente de boto3 que se construye en el primer uso.
+
+    ``config`` es un dict con los argumentos de ``botocore.config.Config``.
+    La creación va protegida con un lock porque la sesión por defecto de
+    boto3 no es segura entre hilos.
+    """
+
+    def __init__(self, service, config=None):
+        self._service = service
+        self._config = config
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._client is not None
+
+    def _get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.config import Config
+
+                    config = Config(**self._config) if self._config else None
+                    self._client = boto3.client(self._service, config=config)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
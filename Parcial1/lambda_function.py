@@ -1,16 +1,53 @@
 import datetime
+import gzip
+import hashlib
+import json
 import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlparse
+
 import requests
-import boto3
+from botocore.exceptions import ClientError
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from clients import LazyClient
+from metrics import Metrics
 
 # Configuración del logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
+metrics = Metrics.from_env("parcial1")
+
+# Configuración del crawler (sobrescribible con variables de entorno)
+CRAWLER_MODE = os.environ.get("CRAWLER_MODE", "serial")  # serial | threads
+MAX_LISTINGS = int(os.environ.get("MAX_LISTINGS", "10"))
+MAX_SEARCH_PAGES = int(os.environ.get("MAX_SEARCH_PAGES", "50"))
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", "8"))
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", "4"))
+HOST_MIN_INTERVAL = float(os.environ.get("HOST_MIN_INTERVAL", "0.1"))
+MAX_RETRIES = int(os.environ.get("MAX_RETRIES", "3"))
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "15"))
+# daily: {día}/{día}-property-{i}.html | content: objetos por hash + índice
+STORAGE_LAYOUT = os.environ.get("STORAGE_LAYOUT", "daily")
+# Margen (en segundos) que se deja libre antes del timeout de Lambda: las
+# peticiones ya se recortan al límite, solo queda vaciar las subidas en
+# curso y escribir el índice
+TIMEOUT_MARGIN = float(os.environ.get("TIMEOUT_MARGIN", "3"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
 
 # Configuración de S3
 S3_BUCKET_HTML = "landing-casas-parcial"
-s3_client = boto3.client("s3")
+s3_client = LazyClient(
+    "s3", config={"max_pool_connections": max(10, UPLOAD_WORKERS)})
+
+CACHE_KEY = "_cache/listings.json"
+CONTENT_PREFIX = "objects"
 
 # URL de búsqueda de apartaestudios en Bogotá
 BASE_URL = "https://casas.mitula.com.co/find"
@@ -29,56 +66,483 @@ HEADERS = {
 }
 
 
-def get_property_links():
-    """Extrae las 10 primeras URLs de los inmuebles"""
+class DeadlineExceeded(requests.exceptions.RequestException):
+    """No queda tiempo antes del límite de la invocación para la petición."""
+
+
+def _request_timeout(deadline):
+    """Timeout de una petición, recortado a lo que queda hasta ``deadline``.
+
+    Lanza :class:`DeadlineExceeded` si ya no queda tiempo.
+    """
+    if deadline is None:
+        return REQUEST_TIMEOUT
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Sin tiempo antes del límite de Lambda")
+    return min(REQUEST_TIMEOUT, remaining)
+
+
+class HostRateLimiter:
+    """Limita la tasa de peticiones por host con backoff adaptativo.
+
+    Cada host tiene un intervalo mínimo entre peticiones. Un 429/5xx
+    duplica el intervalo (hasta ``max_interval``) y cada respuesta correcta
+    lo reduce poco a poco hasta volver a ``min_interval``.
+    """
+
+    def __init__(self, min_interval=None, max_interval=30.0):
+        if min_interval is None:
+            min_interval = HOST_MIN_INTERVAL
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._lock = threading.Lock()
+        self._interval = {}
+        self._next_slot = {}
+
+    def wait(self, host, deadline=None):
+        """Bloquea hasta que el host tenga un turno libre.
+
+        Si el turno cae después de ``deadline`` no espera ni lo reserva y
+        lanza :class:`DeadlineExceeded`.
+        """
+        with self._lock:
+            now = time.monotonic()
+            interval = self._interval.get(host, self.min_interval)
+            slot = max(now, self._next_slot.get(host, now))
+            if deadline is not None and slot >= deadline:
+                raise DeadlineExceeded(f"Sin turno para {host} a tiempo")
+            self._next_slot[host] = slot + interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def success(self, host):
+        with self._lock:
+            interval = self._interval.get(host, self.min_interval)
+            self._interval[host] = max(self.min_interval, interval * 0.9)
+
+    def backoff(self, host, retry_after=None):
+        """Aumenta el intervalo del host tras un 429/5xx."""
+        with self._lock:
+            interval = self._interval.get(host, self.min_interval)
+            interval = min(self.max_interval, max(interval * 2, 0.5))
+            if retry_after is not None:
+                interval = min(self.max_interval, max(interval, retry_after))
+            self._interval[host] = interval
+            now = time.monotonic()
+            self._next_slot[host] = max(
+                self._next_slot.get(host, now), now + interval)
+
+
+def _retry_after_seconds(response):
+    """Interpreta la cabecera Retry-After (segundos o fecha HTTP)."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
     try:
-        response = requests.get(BASE_URL, params=PARAMS, headers=HEADERS)
+        delta = parsedate_to_datetime(value) - datetime.datetime.now(
+            datetime.timezone.utc)
+        return max(0.0, delta.total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def build_session(pool_size=DOWNLOAD_WORKERS):
+    """Crea una sesión HTTP con un pool de conexiones reutilizables."""
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def fetch(session, url, limiter, params=None, headers=None,
+          max_retries=MAX_RETRIES, deadline=None):
+    """GET con limitación por host y reintentos ante 429/5xx.
+
+    Con ``deadline`` ni las esperas ni los timeouts pasan de ese instante.
+    """
+    host = urlparse(url).netloc
+    for attempt in range(max_retries + 1):
+        limiter.wait(host, deadline)
+        timeout = _request_timeout(deadline)
+        with metrics.timer("http"):
+            response = session.get(url, params=params, headers=headers,
+                                   timeout=timeout)
+        if response.status_code in RETRY_STATUS and attempt < max_retries:
+            metrics.count("retries")
+            limiter.backoff(host, _retry_after_seconds(response))
+            logger.warning(
+                f"🔁 {response.status_code} en {url}, "
+                f"reintento {attempt + 1}/{max_retries}")
+            continue
         response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"❌ Error al acceder a {BASE_URL}: {e}")
-        return []
+        limiter.success(host)
+        return response
+
+
+def _next_page_url(soup, current_url):
+    """Devuelve la URL de la siguiente página de resultados, si existe."""
+    link = soup.select_one("link[rel='next'][href], a[rel='next'][href]")
+    if link is None:
+        return None
+    return urljoin(current_url, link["href"])
+
+
+def get_property_links(max_links=None, max_pages=None, session=None,
+                       limiter=None, deadline=None):
+    """Extrae hasta ``max_links`` URLs únicas siguiendo la paginación.
+
+    Las tarjetas repiten el enlace al inmueble, así que se deduplica antes
+    de contar contra el límite. Sin ``session`` usa ``requests.get``
+    directamente; con ``session`` (modo crawler) reutiliza sus conexiones
+    y respeta el ``limiter`` por host.
+    Por defecto usa ``MAX_LISTINGS`` y ``MAX_SEARCH_PAGES``.
+    """
+    max_links = MAX_LISTINGS if max_links is None else max_links
+    max_pages = MAX_SEARCH_PAGES if max_pages is None else max_pages
+    # dict como conjunto ordenado: conserva el orden de aparición
+    property_links = {}
+    url, params = BASE_URL, PARAMS
+    for _ in range(max_pages):
+        try:
+            if session is None:
+                timeout = _request_timeout(deadline)
+                with metrics.timer("http"):
+                    response = requests.get(
+                        url, params=params, headers=HEADERS, timeout=timeout)
+                response.raise_for_status()
+            else:
+                response = fetch(session, url, limiter, params=params,
+                                 deadline=deadline)
+        except DeadlineExceeded:
+            logger.warning("⏱️ Tiempo agotado recorriendo la paginación.")
+            break
+        except requests.exceptions.RequestException as e:
+            metrics.count("http_errors")
+            logger.error(f"❌ Error al acceder a {url}: {e}")
+            break
+
+        metrics.count("search_pages")
+        with metrics.timer("search_parse"):
+            soup = BeautifulSoup(response.text, "html.parser")
+            for link in soup.select("a[href^='/listing/']"):
+                if len(property_links) >= max_links:
+                    break
+                property_links.setdefault(urljoin(url, link["href"]))
+            next_url = _next_page_url(soup, url)
 
-    soup = BeautifulSoup(response.text, "html.parser")
-    property_links = [
-        f"https://casas.mitula.com.co{link['href']}"
-        for link in soup.select("a[href^='/listing/']")[:10]
-    ]
+        url, params = next_url, None
+        if len(property_links) >= max_links or url is None:
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            logger.warning("⏱️ Tiempo agotado recorriendo la paginación.")
+            break
 
-    logger.info(f"🔗 URLs extraídas: {property_links}")
-    return property_links
+    logger.info(f"🔗 URLs extraídas: {len(property_links)}")
+    return list(property_links)
 
 
-def download_and_save_html():
+def _count_page(response):
+    metrics.count("pages")
+    metrics.count("bytes_downloaded", len(response.content))
+    metrics.observe("page_bytes", len(response.content))
+
+
+def _html_bytes(response):
+    """HTML de la respuesta en UTF-8, que es como lo lee ``lambda_csv``.
+
+    Si la página ya es UTF-8 (o ASCII) se guarda tal cual; si no, se
+    re-codifica desde el charset de la respuesta.
+    """
+    body = response.content
+    try:
+        body.decode("utf-8")
+    except UnicodeDecodeError:
+        metrics.count("recoded_pages")
+        return response.text.encode("utf-8")
+    return body
+
+
+def _save_html(key, body):
+    with metrics.timer("s3_put"):
+        s3_client.put_object(
+            Bucket=S3_BUCKET_HTML,
+            Key=key,
+            Body=body,
+            ContentType="text/html",
+        )
+    logger.info(f"✅ Guardado: {key}")
+
+
+def content_key(sha256):
+    return f"{CONTENT_PREFIX}/{sha256[:2]}/{sha256}.html.gz"
+
+
+class ListingCache:
+    """Caché por URL de inmueble para no descargar ni guardar lo repetido.
+
+    Recuerda ETag/Last-Modified y el hash SHA-256 del HTML de cada
+    inmueble. Las páginas que cambian se guardan comprimidas bajo su hash
+    (``objects/ab/<hash>.html.gz``) y cada día se escribe un índice
+    ``{día}/index.json`` que apunta a todas, cambien o no.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+        self.index = []
+        self.stored = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        try:
+            obj = s3_client.get_object(Bucket=S3_BUCKET_HTML, Key=CACHE_KEY)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return cls()
+            raise
+        return cls(json.loads(obj["Body"].read()))
+
+    def save(self):
+        s3_client.put_object(
+            Bucket=S3_BUCKET_HTML,
+            Key=CACHE_KEY,
+            Body=json.dumps(self.entries).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+    def conditional_headers(self, url):
+        """Cabeceras para una petición condicional a ``url``."""
+        cached = self.entries.get(url, {})
+        headers = {}
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+        return headers
+
+    def store(self, url, response):
+        """Registra la respuesta de ``url`` y guarda el HTML si cambió."""
+        with self._lock:
+            cached = dict(self.entries.get(url, {}))
+        if response.status_code == 304 and cached.get("sha256"):
+            metrics.count("not_modified")
+            sha256, changed = cached["sha256"], False
+        else:
+            body = _html_bytes(response)
+            sha256 = hashlib.sha256(body).hexdigest()
+            changed = sha256 != cached.get("sha256")
+            if changed:
+                self._put_content(sha256, body)
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        cached.update({k: v for k, v in validators.items() if v})
+        cached["sha256"] = sha256
+        with self._lock:
+            self.entries[url] = cached
+            self.stored += changed
+            self.index.append({
+                "url": url,
+                "sha256": sha256,
+                "key": content_key(sha256),
+                "changed": changed,
+            })
+        logger.info(f"{'✅ Guardado' if changed else '⏭️ Sin cambios'}: {url}")
+
+    def _put_content(self, sha256, body):
+        try:
+            with metrics.timer("s3_put"):
+                s3_client.put_object(
+                    Bucket=S3_BUCKET_HTML,
+                    Key=content_key(sha256),
+                    Body=gzip.compress(body, mtime=0),
+                    ContentType="text/html",
+                    ContentEncoding="gzip",
+                    IfNoneMatch="*",
+                )
+        except ClientError as e:
+            # Otro inmueble ya guardó exactamente el mismo contenido
+            if e.response.get("Error", {}).get("Code") != "PreconditionFailed":
+                raise
+
+    def write_index(self, today):
+        index = {
+            "day": today,
+            "listings": sorted(self.index, key=lambda entry: entry["url"]),
+        }
+        s3_client.put_object(
+            Bucket=S3_BUCKET_HTML,
+            Key=f"{today}/index.json",
+            Body=json.dumps(index).encode("utf-8"),
+            ContentType="application/json",
+        )
+        logger.info(
+            f"✅ Índice {today}: {len(self.index)} inmuebles, "
+            f"{self.stored} con cambios")
+
+
+def _finished_uploads(futures):
+    """Cuenta las subidas correctas y registra las fallidas."""
+    ok = 0
+    for future in futures:
+        try:
+            future.result()
+            ok += 1
+        except Exception as e:
+            metrics.count("upload_errors")
+            logger.error(f"❌ Error subiendo a S3: {e}")
+    return ok
+
+
+def crawl_and_save_html(today, deadline=None, workers=DOWNLOAD_WORKERS,
+                        upload_workers=UPLOAD_WORKERS, cache=None):
+    """Modo crawler: descargas concurrentes con subidas a S3 solapadas.
+
+    Devuelve el número de páginas procesadas. Si se acerca ``deadline``
+    (``time.monotonic()``) deja de lanzar descargas nuevas. Con ``cache``
+    las peticiones son condicionales y se guarda por contenido.
+    """
+    limiter = HostRateLimiter()
+    session = build_session(workers)
+    try:
+        links = get_property_links(
+            session=session, limiter=limiter, deadline=deadline)
+        if not links:
+            logger.warning("❌ No se encontraron propiedades para descargar.")
+            return 0
+
+        def download(i, url):
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            headers = cache.conditional_headers(url) if cache else None
+            response = fetch(session, url, limiter, headers=headers,
+                             deadline=deadline)
+            _count_page(response)
+            return i, url, response
+
+        # Ventanas acotadas de descargas y subidas en curso: cada una
+        # retiene un HTML, así la memoria no crece con el número de enlaces
+        saved = 0
+        pending = iter(enumerate(links))
+        downloading = {}
+        uploading = set()
+        with ThreadPoolExecutor(upload_workers) as uploads, \
+                ThreadPoolExecutor(workers) as downloads:
+            while True:
+                for i, url in pending:
+                    downloading[downloads.submit(download, i, url)] = url
+                    if len(downloading) >= 2 * workers:
+                        break
+                if not downloading:
+                    break
+                done, _ = wait(downloading, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = downloading.pop(future)
+                    try:
+                        result = future.result()
+                    except DeadlineExceeded:
+                        continue
+                    except requests.exceptions.RequestException as e:
+                        metrics.count("http_errors")
+                        logger.error(f"❌ Error al descargar {url}: {e}")
+                        continue
+                    if result is None:
+                        continue
+                    i, url, response = result
+                    if cache is not None:
+                        upload = uploads.submit(cache.store, url, response)
+                    else:
+                        key = f"{today}/{today}-property-{i+1}.html"
+                        upload = uploads.submit(
+                            _save_html, key, _html_bytes(response))
+                    uploading.add(upload)
+                if len(uploading) >= 2 * upload_workers:
+                    done, uploading = wait(
+                        uploading, return_when=FIRST_COMPLETED)
+                    saved += _finished_uploads(done)
+            saved += _finished_uploads(wait(uploading).done)
+        skipped = len(links) - saved
+        if skipped:
+            logger.warning(f"⚠️ {skipped} inmuebles no se guardaron.")
+        return saved
+    finally:
+        session.close()
+
+
+def download_and_save_html(mode=None, deadline=None, layout=None):
     """Descarga los detalles de cada inmueble y guarda el HTML en S3."""
     today = datetime.datetime.today().strftime("%Y-%m-%d")
-    property_links = get_property_links()
+    cache = None
+    if (layout or STORAGE_LAYOUT) == "content":
+        cache = ListingCache.load()
+
+    if (mode or CRAWLER_MODE) == "threads":
+        crawl_and_save_html(today, deadline=deadline, cache=cache)
+    else:
+        _download_serial(today, deadline, cache)
+
+    if cache is not None and cache.index:
+        cache.write_index(today)
+        cache.save()
+
+
+def _download_serial(today, deadline, cache):
+    property_links = get_property_links(deadline=deadline)
 
     if not property_links:
         logger.warning("❌ No se encontraron propiedades para descargar.")
         return
 
     for i, url in enumerate(property_links):
+        if deadline is not None and time.monotonic() >= deadline:
+            logger.warning("⏱️ Tiempo agotado, se detienen las descargas.")
+            break
+        headers = HEADERS
+        if cache is not None:
+            headers = {**HEADERS, **cache.conditional_headers(url)}
         try:
-            response = requests.get(url, headers=HEADERS)
+            timeout = _request_timeout(deadline)
+            with metrics.timer("http"):
+                response = requests.get(url, headers=headers, timeout=timeout)
             response.raise_for_status()
+        except DeadlineExceeded:
+            logger.warning("⏱️ Tiempo agotado, se detienen las descargas.")
+            break
         except requests.exceptions.RequestException as e:
+            metrics.count("http_errors")
             logger.error(f"❌ Error al descargar {url}: {e}")
             continue
+        _count_page(response)
 
-        file_name = f"{today}-property-{i+1}.html"
+        if cache is not None:
+            cache.store(url, response)
+            continue
 
         # Guardar HTML en S3
-        s3_client.put_object(
-            Bucket=S3_BUCKET_HTML,
-            Key=f"{today}/{file_name}",
-            Body=response.text.encode("utf-8"),
-            ContentType="text/html",
-        )
-        logger.info(f"✅ Guardado: {file_name}")
+        _save_html(f"{today}/{today}-property-{i+1}.html",
+                   _html_bytes(response))
+
+
+def _deadline_from_context(context):
+    """Calcula el instante límite de trabajo según el tiempo de Lambda."""
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return None
+    remaining = context.get_remaining_time_in_millis() / 1000.0
+    return time.monotonic() + max(0.0, remaining - TIMEOUT_MARGIN)
 
 
+@metrics.instrument
 def lambda_handler(event, context):
-    download_and_save_html()
+    download_and_save_html(deadline=_deadline_from_context(context))
     return {"statusCode": 200, "body": "Scraping completo"}
 
 # Añadir una línea en blanco al final del archivo
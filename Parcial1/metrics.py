@@ -0,0 +1,219 @@
+"""Métricas por etapa para las Lambdas, emitidas en formato CloudWatch EMF.
+
+Uso típico::
+
+    metrics = Metrics.from_env("parcial1")
+
+    with metrics.timer("http"):
+        ...
+    metrics.count("pages")
+
+    @metrics.instrument
+    def lambda_handler(event, context):
+        ...
+
+Al final de cada invocación se imprime una sola línea JSON con los
+temporizadores, contadores e histogramas. Con ``METRICS_ENABLED=0`` todas
+las llamadas son no-ops. ``PROFILE_SLOW_MS`` activa un perfilador por
+muestreo que registra los frames más calientes de las invocaciones lentas.
+
+Este módulo se comparte entre Parcial1 y Parcial2 (enlace simbólico).
+"""
+import collections
+import functools
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger()
+
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "BigDataScraper")
+# Directorio del paquete desplegado: el perfilador solo cuenta sus frames
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+# EMF admite como mucho 100 valores distintos por métrica
+EMF_MAX_VALUES = 100
+
+
+def _round_sig(value, digits):
+    if value == 0:
+        return 0.0
+    return round(value, digits - 1 - int(math.floor(math.log10(abs(value)))))
+
+
+def _histogram(values):
+    """Comprime una lista de valores en ``{"Values": [...], "Counts": [...]}``.
+
+    Los valores se redondean a 2 cifras significativas (1 si aún hay
+    demasiados) para respetar el límite de EMF.
+    """
+    for digits in (2, 1):
+        counts = collections.Counter(_round_sig(v, digits) for v in values)
+        if len(counts) <= EMF_MAX_VALUES:
+            break
+    items = sorted(counts.items())[:EMF_MAX_VALUES]
+    return {"Values": [v for v, _ in items], "Counts": [c for _, c in items]}
+
+
+def _unit(name, default):
+    if name.endswith("_ms"):
+        return "Milliseconds"
+    if "bytes" in name:
+        return "Bytes"
+    return default
+
+
+class Metrics:
+    """Temporizadores, contadores e histogramas de una invocación."""
+
+    def __init__(self, service, namespace=NAMESPACE, enabled=True):
+        self.service = service
+        self.namespace = namespace
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_env(cls, service):
+        enabled = os.environ.get("METRICS_ENABLED", "1").lower()
+        return cls(service, enabled=enabled not in ("0", "false"))
+
+    def reset(self):
+        self.counters = collections.Counter()
+        self.histograms = collections.defaultdict(list)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += value
+
+    def observe(self, name, value):
+        """Añade una muestra al histograma ``name``."""
+        if self.enabled:
+            with self._lock:
+                self.histograms[name].append(value)
+
+    def timer(self, stage):
+        """Context manager que registra la duración en ``<stage>_ms``."""
+        if not self.enabled:
+            return nullcontext()
+        return self._timer(stage)
+
+    @contextmanager
+    def _timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{stage}_ms", (time.perf_counter() - start) * 1000)
+
+    def emf(self, dimensions=None):
+        """Documento EMF con todo lo registrado hasta ahora."""
+        dimensions = {"Service": self.service, **(dimensions or {})}
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {k: list(v) for k, v in self.histograms.items()}
+        definitions = [
+            {"Name": name, "Unit": _unit(name, "Count")} for name in counters]
+        definitions += [
+            {"Name": name, "Unit": _unit(name, "None")} for name in histograms]
+        document = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [sorted(dimensions)],
+                    "Metrics": definitions,
+                }],
+            },
+            **dimensions,
+            **counters,
+        }
+        document.update(
+            (name, _histogram(values)) for name, values in histograms.items())
+        return document
+
+    def flush(self, dimensions=None):
+        """Imprime la línea EMF de la invocación y reinicia las métricas."""
+        if not self.enabled:
+            return
+        print(json.dumps(self.emf(dimensions), separators=(",", ":")),
+              flush=True)
+        self.reset()
+
+    def instrument(self, handler):
+        """Decora un ``lambda_handler`` para medirlo y emitir sus métricas."""
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            profiler = SamplingProfiler.from_env()
+            start = time.perf_counter()
+            try:
+                with self.timer("invocation"):
+                    return handler(event, context)
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if profiler is not None:
+                    profiler.stop()
+                    if elapsed_ms >= profiler.slow_ms:
+                        profiler.log_top()
+                self.flush()
+        return wrapper
+
+
+def _in_package(frame):
+    return frame.f_code.co_filename.startswith(PACKAGE_DIR)
+
+
+class SamplingProfiler:
+    """Perfilador por muestreo del código del paquete.
+
+    Un hilo en segundo plano mira ``sys._current_frames()`` cada
+    ``interval`` segundos y cuenta, por hilo, el frame más interno que
+    pertenece al paquete (los hilos ociosos de los pools no cuentan).
+    """
+
+    def __init__(self, slow_ms, interval=0.005, top=15):
+        self.slow_ms = slow_ms
+        self.interval = interval
+        self.top = top
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls):
+        slow_ms = os.environ.get("PROFILE_SLOW_MS")
+        return cls(float(slow_ms)) if slow_ms else None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                while frame is not None and not _in_package(frame):
+                    frame = frame.f_back
+                if frame is None:
+                    continue
+                code = frame.f_code
+                self.samples[
+                    (code.co_filename, frame.f_lineno, code.co_name)] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def log_top(self):
+        total = sum(self.samples.values()) or 1
+        lines = [
+            f"{count * 100 / total:5.1f}% {os.path.basename(path)}:{line} "
+            f"{name}"
+            for (path, line, name), count in self.samples.most_common(self.top)
+        ]
+        lines.insert(0, "🔥 Invocación lenta, frames más calientes:")
+        logger.warning("\n".join(lines))
@@ -1,4 +1,9 @@
 import pytest
+import requests
+import gzip
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, MagicMock
 from bs4 import BeautifulSoup
 import sys
@@ -6,7 +11,12 @@ import os
 
 # Agregar el path de Parcial2 después de las importaciones
 sys.path.insert(0, os.path.abspath("../Parcial2"))  # noqa: E402
+# S3 en memoria compartido con el benchmark
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
 
+import lambda_csv
+from fakes3 import FakeS3
 from lambda_csv import extract_property_data
 from lambda_function import get_property_links, download_and_save_html
 
@@ -48,16 +58,17 @@ def mock_requests_get():
         def side_effect(url, *args, **kwargs):
             if "find" in url:
                 return MagicMock(status_code=200, text=HTML_LISTADO)
-            return MagicMock(status_code=200, text=HTML_PROPIEDAD)
+            return MagicMock(status_code=200, text=HTML_PROPIEDAD,
+                             content=HTML_PROPIEDAD.encode("utf-8"))
 
         mock_get.side_effect = side_effect
         yield mock_get
 
 
 def test_get_property_links(mock_requests_get):
-    """Prueba que extrae correctamente los 10 enlaces de inmuebles."""
+    """Prueba que extrae los 4 inmuebles únicos de los 10 enlaces."""
     links = get_property_links()
-    assert len(links) == 10
+    assert len(links) == 4
     base_url = "https://casas.mitula.com.co/listing/"
     assert links[0] == f"{base_url}mitula-CO-9100034721910450243"
 
@@ -81,5 +92,501 @@ def test_download_and_process(mock_requests_get):
     """Prueba la función de descarga, verificando la subida a S3 con mock."""
     with patch("lambda_function.s3_client.put_object") as mock_put_object:
         download_and_save_html()
-        # Verificar que se subieron los archivos HTML
-        assert mock_put_object.call_count >= 10
+        # Verificar que se subió un HTML por inmueble único
+        assert mock_put_object.call_count == 4
+
+
+@pytest.mark.parametrize("mode", ["serial", "threads"])
+def test_html_se_guarda_en_utf8(mode):
+    """Prueba que una página en ISO-8859-1 se guarda re-codificada en UTF-8."""
+    def get(url, *args, **kwargs):
+        if "find" in url:
+            return MagicMock(status_code=200, text=HTML_LISTADO)
+        response = requests.models.Response()
+        response.status_code = 200
+        response._content = HTML_PROPIEDAD.encode("latin-1")
+        response.encoding = "ISO-8859-1"
+        return response
+
+    s3 = FakeS3()
+    with patch("requests.get", side_effect=get), \
+            patch("requests.Session.get", side_effect=get), \
+            patch("lambda_function.s3_client", s3):
+        download_and_save_html(mode=mode, layout="daily")
+
+    bodies = [entry[0] for entry in s3.objects.values()]
+    assert len(bodies) == 4
+    assert all(body == HTML_PROPIEDAD.encode("utf-8") for body in bodies)
+
+
+def test_get_property_links_sigue_paginacion():
+    """Prueba que se recorren varias páginas de resultados."""
+    # Los enlaces repetidos no cuentan contra el límite
+    pagina_1 = (
+        '<html><head><link rel="next" href="/find?page=2"></head><body>'
+        '<a href="/listing/a"></a><a href="/listing/a"></a>'
+        '<a href="/listing/b"></a>'
+        "</body></html>"
+    )
+    pagina_2 = '<html><body><a href="/listing/c"></a></body></html>'
+    with patch("requests.get") as mock_get:
+        mock_get.side_effect = [
+            MagicMock(status_code=200, text=pagina_1),
+            MagicMock(status_code=200, text=pagina_2),
+        ]
+        links = get_property_links(max_links=3)
+    assert [link.rsplit("/", 1)[1] for link in links] == ["a", "b", "c"]
+    assert mock_get.call_args_list[1].args[0] == (
+        "https://casas.mitula.com.co/find?page=2")
+
+
+def test_crawl_and_save_html_reintenta_429():
+    """Prueba el modo crawler con sesión compartida y reintento ante 429."""
+    from lambda_function import crawl_and_save_html
+
+    respuestas = {}
+
+    def session_get(url, *args, **kwargs):
+        if "find" in url:
+            return MagicMock(status_code=200, text=HTML_LISTADO)
+        # El primer intento de cada inmueble devuelve 429
+        intento = respuestas.setdefault(url, 0)
+        respuestas[url] += 1
+        if intento == 0:
+            return MagicMock(status_code=429, headers={"Retry-After": "0"})
+        return MagicMock(status_code=200, content=HTML_PROPIEDAD.encode())
+
+    with patch("requests.Session.get", side_effect=session_get), \
+            patch("lambda_function.time.sleep"), \
+            patch("lambda_function.s3_client.put_object") as mock_put_object:
+        saved = crawl_and_save_html("2025-01-01")
+
+    # Los 10 enlaces del listado tienen 4 inmuebles distintos
+    assert saved == 4
+    assert mock_put_object.call_count == 4
+    assert all(count == 2 for count in respuestas.values())
+
+
+# Corpus de páginas guardadas con variantes que el escáner debe igualar
+CORPUS_PROPIEDADES = {
+    "basica": HTML_PROPIEDAD,
+    "anidada": (
+        '<div class="layout"><div id="view-map__text"> <span>Chapinero'
+        '</span>, Bogotá <!-- mapa --></div>'
+        '<div class="a prices-and-fees__price b">$ 1.000 &amp; más</div>'
+        '<div class="details"><div class="details-item-value">2<br>hab'
+        '</div><div class="details-item-value"><script>x=1</script>1 baño'
+        '</div><div class="details-item-value">50 m&sup2;</div>'
+        '<div class="details-item-value">Piso 3</div></div></div>'
+    ),
+    # Detalles anidados: el orden es el de apertura, como en find_all
+    "detalles_anidados": (
+        '<div id="view-map__text">Suba</div>'
+        '<div class="prices-and-fees__price">$ 2</div>'
+        '<div class="details-item-value">1<div class="details-item-value">'
+        '2</div></div><div class="details-item-value">3</div>'
+    ),
+    "incompleta": '<div class="details-item-value">3 habitaciones</div>',
+    "vacia": "<html><body><p>Sin datos</p></body></html>",
+}
+
+
+def test_diff_extractors_corpus():
+    """Prueba que el escáner rápido y el árbol completo coinciden."""
+    assert lambda_csv.diff_extractors(CORPUS_PROPIEDADES) == {}
+    for html in CORPUS_PROPIEDADES.values():
+        expected = extract_property_data(BeautifulSoup(html, "html.parser"))
+        assert lambda_csv.extract_from_html(html, "fast") == expected
+
+
+def _s3_event(s3, keys):
+    return {"Records": [
+        {"s3": {"object": {
+            "key": key,
+            "eTag": s3.objects[(lambda_csv.S3_BUCKET_HTML, key)][1].strip('"'),
+        }}}
+        for key in keys
+    ]}
+
+
+def test_process_event_incremental():
+    """Prueba que solo se parsean los objetos nuevos del evento S3."""
+    s3 = FakeS3()
+    html_bucket = lambda_csv.S3_BUCKET_HTML
+    for i in (1, 2):
+        s3.put_object(html_bucket, f"2025-01-01/p-{i}.html", HTML_PROPIEDAD)
+
+    with patch("lambda_csv.s3_client", s3):
+        assert lambda_csv.process_event(
+            _s3_event(s3, ["2025-01-01/p-1.html"])) == 1
+        assert lambda_csv.process_event(
+            _s3_event(s3, ["2025-01-01/p-1.html", "2025-01-01/p-2.html"])) == 1
+        # Un evento repetido no vuelve a descargar ni parsear el HTML
+        s3.gets.clear()
+        assert lambda_csv.process_event(
+            _s3_event(s3, ["2025-01-01/p-2.html"])) == 0
+        assert s3.gets == ["_checkpoints/2025-01-01.json"]
+
+    csv_key = "2025-01-01/2025-01-01.csv.gz"
+    body = s3.objects[(lambda_csv.S3_BUCKET_CSV, csv_key)]
+    rows = gzip.decompress(body[0]).decode("utf-8").splitlines()
+    assert len(rows) == 3
+    assert rows[1].startswith("2025-01-01,\"Bogotá, Cundinamarca\"")
+
+
+def test_process_html_files_backfill_paginado():
+    """Prueba que el backfill recorre más de 1000 objetos."""
+    s3 = FakeS3()
+    for i in range(1001):
+        s3.put_object(lambda_csv.S3_BUCKET_HTML,
+                      f"2025-01-02/p-{i}.html", HTML_PROPIEDAD)
+
+    with patch("lambda_csv.s3_client", s3):
+        assert lambda_csv.process_html_files() == 1001
+        assert lambda_csv.process_html_files() == 0
+
+
+@pytest.mark.parametrize("parse_workers", [1, 2])
+def test_fetch_and_parse_pipeline(parse_workers):
+    """Prueba el pipeline lectores/parseadores, con y sin procesos."""
+    s3 = FakeS3()
+    keys = [f"2025-01-03/p-{i}.html" for i in range(40)]
+    for key in keys:
+        s3.put_object(lambda_csv.S3_BUCKET_HTML, key, HTML_PROPIEDAD)
+
+    with patch("lambda_csv.s3_client", s3):
+        results = list(lambda_csv.fetch_and_parse(
+            keys + ["2025-01-03/falta.html"],
+            read_workers=3, parse_workers=parse_workers))
+
+    assert [key for key, _, _ in results[:-1]] == keys
+    assert results[0][2] == extract_property_data(
+        BeautifulSoup(HTML_PROPIEDAD, "html.parser"))
+    assert results[-1] == ("2025-01-03/falta.html", None, None)
+
+
+def test_stream_csv_multipart():
+    """Prueba la subida por partes comprimida y el aborto ante errores."""
+    s3 = FakeS3()
+    rows = [["2025-01-04", f"Barrio {i}", "$ 1", "1", "1", "30 m²"]
+            for i in range(5000)]
+    with patch("lambda_csv.s3_client", s3), \
+            patch("lambda_csv.MULTIPART_PART_SIZE", 1024):
+        key = lambda_csv.stream_csv("2025-01-04/2025-01-04.csv", rows)
+        with pytest.raises(RuntimeError):
+            with lambda_csv.S3MultipartWriter(
+                    lambda_csv.S3_BUCKET_CSV, "roto.csv", "text/csv",
+                    part_size=10) as raw:
+                raw.write(b"x" * 50)
+                raise RuntimeError("fallo a mitad")
+
+    assert key == "2025-01-04/2025-01-04.csv.gz"
+    body = s3.objects[(lambda_csv.S3_BUCKET_CSV, key)][0]
+    lines = gzip.decompress(body).decode("utf-8").splitlines()
+    assert len(lines) == 5001
+    assert lines[-1] == "2025-01-04,Barrio 4999,$ 1,1,1,30 m²"
+    assert (lambda_csv.S3_BUCKET_CSV, "roto.csv") not in s3.objects
+    assert s3.uploads == {}
+
+
+def test_write_day_partitions():
+    """Prueba el layout particionado por barrio con manifiesto."""
+    s3 = FakeS3()
+    state = {
+        "d/p-1.html": {"etag": "1", "row": ["Chapinero", "$ 1", "", "", ""]},
+        "d/p-2.html": {"etag": "2", "row": ["Suba", "$ 2", "", "", ""]},
+        "d/p-3.html": {"etag": "3", "row": ["Chapinero", "$ 3", "", "", ""]},
+    }
+    with patch("lambda_csv.s3_client", s3):
+        lambda_csv.write_day_partitions("2025-01-05", state)
+        # Solo se reescribe la partición afectada
+        s3.objects.pop((lambda_csv.S3_BUCKET_CSV,
+                        "2025-01-05/barrio=suba/part.csv.gz"))
+        lambda_csv.write_day_partitions("2025-01-05", state, {"Chapinero"})
+
+    bucket = lambda_csv.S3_BUCKET_CSV
+    manifest = json.loads(s3.objects[(bucket, "2025-01-05/_manifest.json")][0])
+    assert [(p["barrio"], p["rows"]) for p in manifest["partitions"]] == [
+        ("Chapinero", 2), ("Suba", 1)]
+    assert (bucket, "2025-01-05/barrio=suba/part.csv.gz") not in s3.objects
+    chapinero = s3.objects[(bucket, manifest["partitions"][0]["key"])][0]
+    assert gzip.decompress(chapinero).decode("utf-8").count("\n") == 3
+
+
+def test_content_addressed_dedup():
+    """Prueba la caché por URL, el 304 y la reutilización de filas."""
+    from lambda_function import ListingCache
+
+    s3 = FakeS3()
+    enviados = []
+
+    def get(url, *args, headers=None, **kwargs):
+        if "find" in url:
+            return MagicMock(status_code=200, text=HTML_LISTADO)
+        enviados.append(headers or {})
+        if headers and headers.get("If-None-Match") == url[-3:]:
+            return MagicMock(status_code=304, headers={})
+        return MagicMock(status_code=200, content=HTML_PROPIEDAD.encode(),
+                         headers={"ETag": url[-3:]})
+
+    with patch("requests.get", side_effect=get), \
+            patch("lambda_function.s3_client", s3), \
+            patch("lambda_csv.s3_client", s3), \
+            patch("lambda_function.datetime") as mock_datetime:
+        for day in ("2025-02-01", "2025-02-02"):
+            mock_datetime.datetime.today.return_value.strftime.return_value = (
+                day)
+            download_and_save_html(mode="serial", layout="content")
+            lambda_csv.process_index(f"{day}/index.json")
+
+    html_bucket = lambda_csv.S3_BUCKET_HTML
+    # Los 4 inmuebles comparten contenido: un único objeto comprimido
+    contenidos = [k for b, k in s3.objects if k.startswith("objects/")]
+    assert len(contenidos) == 1
+    assert gzip.decompress(s3.objects[(html_bucket, contenidos[0])][0]) == (
+        HTML_PROPIEDAD.encode())
+    # El segundo día todas las peticiones son condicionales y dan 304
+    assert all("If-None-Match" in headers for headers in enviados[4:])
+    indice = json.loads(s3.objects[(html_bucket, "2025-02-02/index.json")][0])
+    assert len(indice["listings"]) == 4
+    assert not any(entry["changed"] for entry in indice["listings"])
+    cache = ListingCache(json.loads(
+        s3.objects[(html_bucket, "_cache/listings.json")][0]))
+    assert len(cache.entries) == 4
+    # El HTML solo se descargó para parsear el primer día
+    assert s3.gets.count(contenidos[0]) == 1
+    csv_key = "2025-02-02/2025-02-02.csv.gz"
+    csv_body = s3.objects[(lambda_csv.S3_BUCKET_CSV, csv_key)][0]
+    csv_lines = gzip.decompress(csv_body).decode("utf-8").splitlines()
+    assert "Bogotá" in csv_lines[1]
+    # Una fila por inmueble aunque compartan contenido
+    assert len(csv_lines) == 1 + len(indice["listings"])
+
+
+def test_metrics_emf(capsys, monkeypatch, caplog):
+    """Prueba que cada invocación emite una única línea EMF."""
+    from metrics import Metrics
+
+    metrics = Metrics("prueba")
+
+    @metrics.instrument
+    def handler(event, context):
+        with metrics.timer("http"):
+            metrics.count("pages", 3)
+        metrics.observe("page_bytes", 1200)
+        return "ok"
+
+    monkeypatch.setenv("PROFILE_SLOW_MS", "0")
+    assert handler({}, None) == "ok"
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    emf = json.loads(lines[0])
+    definitions = emf["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+    assert {"Name": "pages", "Unit": "Count"} in definitions
+    assert emf["Service"] == "prueba"
+    assert emf["pages"] == 3
+    assert emf["page_bytes"] == {"Values": [1200], "Counts": [1]}
+    assert sum(emf["http_ms"]["Counts"]) == 1
+    assert "frames más calientes" in caplog.text
+
+    # Desactivadas no registran ni imprimen nada
+    disabled = Metrics("prueba", enabled=False)
+    with disabled.timer("http"):
+        disabled.count("pages")
+    disabled.flush()
+    assert not disabled.counters and capsys.readouterr().out == ""
+
+
+def test_normalize_row():
+    """Prueba la conversión de los campos crudos a columnas numéricas."""
+    assert lambda_csv.normalize_row([
+        "Bogotá", "$ 335.000.000", "1 habitación", "1 baño", "41 m²",
+    ]) == {"valor": 335000000, "habitaciones": 1, "banos": 1,
+           "mts2": 41.0, "precio_m2": 8170732}
+    # Detalles fuera de orden o ausentes, valor en millones
+    values = lambda_csv.normalize_row(
+        ["Suba", "$ 250 millones", "45,5 m²", "2 baños", "0"])
+    assert values["valor"] == 250000000
+    assert (values["mts2"], values["banos"]) == (45.5, 2)
+    assert values["habitaciones"] is None
+    # El relleno "0" es dato ausente en todos los campos
+    assert set(lambda_csv.normalize_row(lambda_csv.EMPTY_ROW).values()) == {
+        None}
+    # Miles con coma no se truncan
+    assert lambda_csv.parse_number("$ 250,000,000") == 250000000
+    assert lambda_csv.parse_number("$ 1.000.000,50") == 1000000.5
+
+
+def test_aggregates_por_barrio():
+    """Prueba los agregados diarios y su consulta fusionando varios días."""
+    s3 = FakeS3()
+    html_bucket = lambda_csv.S3_BUCKET_HTML
+    precios = {}
+    keys = []
+    for i in range(60):
+        day = f"2025-03-0{1 + i % 3}"
+        barrio = "Chapinero" if i % 2 else "Suba"
+        valor = 100_000_000 + i * 7_000_000
+        html = (HTML_PROPIEDAD.replace("Bogotá, Cundinamarca", barrio)
+                .replace("335.000.000", f"{valor:,}".replace(",", ".")))
+        keys.append(f"{day}/p-{i}.html")
+        s3.put_object(html_bucket, keys[-1], html)
+        precios.setdefault(barrio, []).append(valor / 41)
+
+    with patch("lambda_csv.s3_client", s3):
+        lambda_csv.process_event(_s3_event(s3, keys))
+        days = ["2025-03-01", "2025-03-02", "2025-03-03"]
+        stats = lambda_csv.query_aggregates(days)
+        # Solo se leen los agregados, nunca los CSVs
+        s3.gets.clear()
+        assert lambda_csv.query_aggregates(days) == stats
+        assert s3.gets == [f"_aggregates/{day}.json" for day in days]
+        # Regenerar desde los checkpoints da el mismo resultado
+        for day in days:
+            s3.delete_object(
+                lambda_csv.S3_BUCKET_CSV, f"_aggregates/{day}.json")
+        assert lambda_csv.rebuild_aggregates() == 3
+        assert lambda_csv.query_aggregates(days) == stats
+
+    for barrio, valores in precios.items():
+        valores.sort()
+        assert stats[barrio]["count"] == 30
+        assert stats[barrio]["min"] == round(valores[0])
+        mediana = valores[len(valores) // 2 - 1]
+        assert abs(stats[barrio]["p50"] / mediana - 1) <= 0.02
+
+    csv_key = "2025-03-01/2025-03-01.csv.gz"
+    body = s3.objects[(lambda_csv.S3_BUCKET_CSV, csv_key)][0]
+    header, first = gzip.decompress(body).decode("utf-8").splitlines()[:2]
+    assert header.endswith("ValorCOP,Habitaciones,Banos,AreaM2,PrecioM2")
+    assert first.endswith(",1,1,41.0,2439024")
+
+
+def test_eventos_concurrentes_no_pierden_filas():
+    """Prueba que 100 eventos simultáneos del mismo día llegan todos al CSV."""
+    s3 = FakeS3()
+    keys = [f"2025-04-01/p-{i}.html" for i in range(100)]
+    for key in keys:
+        s3.put_object(lambda_csv.S3_BUCKET_HTML, key, HTML_PROPIEDAD)
+    events = [_s3_event(s3, [key]) for key in keys]
+    s3.latency = 0.03
+
+    with patch("lambda_csv.s3_client", s3), ThreadPoolExecutor(100) as pool:
+        assert sum(pool.map(lambda_csv.process_event, events)) == 100
+
+    checkpoint = s3.objects[(lambda_csv.CHECKPOINT_BUCKET,
+                             "_checkpoints/2025-04-01.json")][0]
+    assert sorted(json.loads(checkpoint)) == sorted(keys)
+    body = s3.objects[(lambda_csv.S3_BUCKET_CSV,
+                       "2025-04-01/2025-04-01.csv.gz")][0]
+    assert len(gzip.decompress(body).decode("utf-8").splitlines()) == 101
+    # Todos los lotes pendientes se fusionaron y borraron
+    assert not [key for _, key in s3.objects if key.startswith("_pending/")]
+
+
+def test_salidas_se_regeneran_si_el_checkpoint_avanza():
+    """Prueba que unas salidas viejas no pisan un checkpoint más nuevo."""
+    s3 = FakeS3()
+    html_bucket = lambda_csv.S3_BUCKET_HTML
+    s3.put_object(html_bucket, "2025-04-02/p-1.html", HTML_PROPIEDAD)
+    write_outputs = lambda_csv.write_outputs
+    llamadas = []
+
+    def write_outputs_con_carrera(day, state, barrios=None):
+        if not llamadas:
+            # Otra invocación guarda su fila mientras esta escribe
+            latest, etag = lambda_csv.load_checkpoint(day)
+            latest["2025-04-02/p-2.html"] = {
+                "etag": "2", "row": ["Suba", "$ 1", "0", "0", "0"]}
+            lambda_csv.save_checkpoint(day, latest, etag)
+        llamadas.append(set(state))
+        write_outputs(day, state, barrios)
+
+    with patch("lambda_csv.s3_client", s3), \
+            patch("lambda_csv.write_outputs", write_outputs_con_carrera):
+        lambda_csv.process_event(_s3_event(s3, ["2025-04-02/p-1.html"]))
+
+    assert len(llamadas) == 2 and len(llamadas[-1]) == 2
+    body = s3.objects[(lambda_csv.S3_BUCKET_CSV,
+                       "2025-04-02/2025-04-02.csv.gz")][0]
+    assert "Suba" in gzip.decompress(body).decode("utf-8")
+
+
+def test_fetch_respeta_deadline():
+    """Prueba que ni el backoff ni el timeout pasan del límite de Lambda."""
+    from lambda_function import DeadlineExceeded, HostRateLimiter, fetch
+
+    session = MagicMock()
+    limiter = HostRateLimiter(min_interval=0)
+    limiter.backoff("h", retry_after=30)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        fetch(session, "http://h/x", limiter, deadline=start + 1)
+    assert time.monotonic() - start < 0.5
+    session.get.assert_not_called()
+
+    session.get.return_value = MagicMock(status_code=200)
+    fetch(session, "http://h/x", HostRateLimiter(min_interval=0),
+          deadline=time.monotonic() + 2)
+    assert session.get.call_args.kwargs["timeout"] <= 2
+
+
+def test_pipe_parser_pool():
+    """Prueba los procesos parseadores por Pipe y la caída de uno."""
+    pool = lambda_csv.PipeParserPool(2)
+    try:
+        fila = pool.parse(HTML_PROPIEDAD.encode("utf-8"), "fast")
+        assert fila[0] == "Bogotá, Cundinamarca"
+        with pytest.raises(UnicodeDecodeError):
+            pool.parse(b"\xff\xfe", "fast")
+        for process, _ in pool._processes:
+            process.kill()
+            process.join()
+        # Los procesos caídos se retiran y se parsea en el propio hilo
+        for _ in range(3):
+            assert pool.parse(HTML_PROPIEDAD.encode("utf-8"), "fast") == fila
+        assert pool._alive == 0
+    finally:
+        pool.shutdown()
+
+
+def test_fetch_and_parse_errores_por_objeto():
+    """Prueba que un objeto roto no aborta el resto del día."""
+    from botocore.exceptions import ReadTimeoutError
+
+    s3 = FakeS3()
+    bucket = lambda_csv.S3_BUCKET_HTML
+    s3.put_object(bucket, "2025-04-03/ok.html", HTML_PROPIEDAD)
+    s3.put_object(bucket, "2025-04-03/latin1.html", "ñ".encode("latin-1"))
+    s3.put_object(bucket, "objects/ab/roto.html.gz", b"no es gzip")
+    s3.put_object(bucket, "2025-04-03/lento.html", HTML_PROPIEDAD)
+    get_object = s3.get_object
+
+    def get_lento(Bucket, Key, **kwargs):
+        if Key.endswith("lento.html"):
+            raise ReadTimeoutError(endpoint_url="https://s3")
+        return get_object(Bucket, Key, **kwargs)
+
+    keys = ["2025-04-03/ok.html", "2025-04-03/latin1.html",
+            "objects/ab/roto.html.gz", "2025-04-03/lento.html"]
+    with patch("lambda_csv.s3_client", s3), \
+            patch.object(s3, "get_object", get_lento):
+        results = list(lambda_csv.fetch_and_parse(
+            keys, read_workers=2, parse_workers=2))
+
+    assert [row is not None for _, _, row in results] == [
+        True, False, False, False]
+
+
+def test_fetch_and_parse_sin_procesos_para_pocas_claves():
+    """Prueba que pocos objetos se parsean sin arrancar procesos."""
+    s3 = FakeS3()
+    s3.put_object(lambda_csv.S3_BUCKET_HTML, "2025-04-04/p.html",
+                  HTML_PROPIEDAD)
+    with patch("lambda_csv.s3_client", s3), \
+            patch("lambda_csv.PipeParserPool") as pool:
+        assert list(lambda_csv.fetch_and_parse([], parse_workers=4)) == []
+        results = list(lambda_csv.fetch_and_parse(
+            ["2025-04-04/p.html"], read_workers=8, parse_workers=4))
+    pool.assert_not_called()
+    assert results[0][2][0] == "Bogotá, Cundinamarca"
@@ -0,0 +1,173 @@
+"""Agregados precalculados de precios por día × barrio.
+
+Cada día se resume en un JSON de pocos KB con, por barrio y por campo
+(``valor``, ``mts2``, ``precio_m2``), el conteo, la suma, el mínimo, el
+máximo y un sketch de cuantiles. Los resúmenes se pueden fusionar, así que
+"mediana del precio por m² por barrio esta semana" sale de sumar siete
+resúmenes sin volver a leer los CSVs::
+
+    semana = merge(load(doc) for doc in documentos)
+    semana["Chapinero"]["precio_m2"].quantile(0.5)
+
+La lectura y escritura en S3 vive en ``lambda_csv``.
+"""
+import collections
+import math
+
+# Error relativo máximo de los cuantiles estimados
+RELATIVE_ACCURACY = 0.01
+FIELDS = ("valor", "mts2", "precio_m2")
+
+
+class QuantileSketch:
+    """Histograma de cubetas logarítmicas (al estilo DDSketch).
+
+    Un valor ``v > 0`` cae en la cubeta ``ceil(log(v) / log(gamma))`` con
+    ``gamma = (1 + a) / (1 - a)``, de modo que cualquier cuantil se estima
+    con error relativo ``a``. Fusionar dos sketches es sumar sus cubetas;
+    para precios en COP un barrio ocupa unas decenas de cubetas.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, bins=None):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = collections.Counter(bins or {})
+        self.count = sum(self.bins.values())
+
+    def add(self, value, count=1):
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[index] += count
+        self.count += count
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Sketches con distinta precisión")
+        self.bins.update(other.bins)
+        self.count += other.count
+
+    def quantile(self, q):
+        """Cuantil ``q`` en [0, 1], o ``None`` si el sketch está vacío."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                break
+        # Punto de la cubeta (gamma^(i-1), gamma^i] con menor error relativo
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "bins": {str(index): n for index, n in sorted(self.bins.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        bins = {int(index): n for index, n in data["bins"].items()}
+        return cls(data["relative_accuracy"], bins)
+
+
+def _pick(choose, current, value):
+    return value if current is None else choose(current, value)
+
+
+class Summary:
+    """Conteo, suma, mínimo, máximo y sketch de cuantiles de un campo."""
+
+    def __init__(self, count=0, total=0.0, minimum=None, maximum=None,
+                 sketch=None):
+        self.count = count
+        self.total = total
+        self.minimum = minimum
+        self.maximum = maximum
+        self.sketch = sketch or QuantileSketch()
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.minimum = _pick(min, self.minimum, value)
+        self.maximum = _pick(max, self.maximum, value)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.minimum = _pick(min, self.minimum, other.minimum)
+            self.maximum = _pick(max, self.maximum, other.maximum)
+        self.sketch.merge(other.sketch)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.minimum,
+            "max": self.maximum,
+            "sketch": self.sketch.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["count"], data["sum"], data["min"], data["max"],
+                   QuantileSketch.from_dict(data["sketch"]))
+
+
+def summarize(records):
+    """Resume ``(barrio, {campo: valor})`` en ``{barrio: {campo: Summary}}``.
+
+    Los valores ``None`` o no positivos (dato ausente) no se cuentan.
+    """
+    summaries = {}
+    for barrio, values in records:
+        fields = summaries.setdefault(
+            barrio, {field: Summary() for field in FIELDS})
+        for field in FIELDS:
+            value = values.get(field)
+            if value is not None and value > 0:
+                fields[field].add(value)
+    return summaries
+
+
+def merge(many):
+    """Fusiona varios ``{barrio: {campo: Summary}}`` en uno nuevo."""
+    merged = {}
+    for summaries in many:
+        for barrio, fields in summaries.items():
+            target = merged.setdefault(
+                barrio, {field: Summary() for field in FIELDS})
+            for field, summary in fields.items():
+                target[field].merge(summary)
+    return merged
+
+
+def dump(day, summaries):
+    """Documento JSON del día."""
+    return {
+        "day": day,
+        "fields": list(FIELDS),
+        "barrios": {
+            barrio: {field: s.to_dict() for field, s in fields.items()}
+            for barrio, fields in sorted(summaries.items())
+        },
+    }
+
+
+def load(document):
+    """Inverso de :func:`dump`: ``{barrio: {campo: Summary}}``."""
+    return {
+        barrio: {
+            field: Summary.from_dict(data) for field, data in fields.items()
+        }
+        for barrio, fields in document["barrios"].items()
+    }
@@ -1,20 +1,85 @@
 import logging
 import datetime
-import boto3
-from bs4 import BeautifulSoup
+import json
+import os
+import time
+from botocore.exceptions import BotoCoreError, ClientError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import unquote_plus
 import csv
+import gzip
 import io
+import re
+import threading
+import unicodedata
+
+import aggregates
+from clients import LazyClient
+from metrics import Metrics
 
 
 # Configuración del logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
+metrics = Metrics.from_env("parcial2")
 
 
 # Configuración de S3
 S3_BUCKET_HTML = "landing-casas-parcial"  # Donde están los HTMLs
 S3_BUCKET_CSV = "csv-bucket-parcial"  # Bucket donde se guardarán los CSVs
-s3_client = boto3.client("s3")
+s3_client = LazyClient("s3")
+
+# Checkpoint por día: {key o URL: {"etag": ..., "row": [...]}} procesados
+CHECKPOINT_BUCKET = os.environ.get("CHECKPOINT_BUCKET", S3_BUCKET_CSV)
+CHECKPOINT_PREFIX = "_checkpoints"
+CHECKPOINT_RETRIES = 5
+# Lotes de filas nuevas por invocación, pendientes de fusionar al checkpoint
+PENDING_PREFIX = "_pending"
+CONFLICT_CODES = ("PreconditionFailed", "ConditionalRequestConflict")
+
+# HTMLs guardados por contenido (Parcial1 con STORAGE_LAYOUT=content) y
+# caché de filas ya extraídas por hash
+CONTENT_PREFIX = "objects/"
+INDEX_FILE = "index.json"
+ROWS_PREFIX = "_rows"
+
+# Agregados precalculados por día × barrio (ver aggregates.py)
+AGGREGATES_PREFIX = "_aggregates"
+
+# Motor de extracción: fast (escáner en streaming con respaldo al árbol
+# completo), full (BeautifulSoup completo) o verify (ambos y compara)
+EXTRACTOR_ENGINE = os.environ.get("EXTRACTOR_ENGINE", "fast")
+
+
+def _available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Pipeline de lectura/parseo: hilos lectores de S3 y procesos parseadores
+READ_WORKERS = int(os.environ.get("READ_WORKERS", "8"))
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", str(_available_cpus())))
+
+# Salida: CSV diario y/o particiones por barrio con manifiesto
+# OUTPUT_LAYOUT: daily | partitioned | both
+OUTPUT_LAYOUT = os.environ.get("OUTPUT_LAYOUT", "daily")
+CSV_COMPRESSION = os.environ.get("CSV_COMPRESSION", "gzip")  # gzip | none
+MULTIPART_PART_SIZE = 8 * 1024 * 1024  # S3 exige >= 5 MiB salvo la última
+
+EMPTY_ROW = ["Desconocido", "0", "0", "0", "0"]
+
+# Columnas numéricas derivadas de la fila cruda (vacías si no hay dato)
+TYPED_FIELDS = ("valor", "habitaciones", "banos", "mts2", "precio_m2")
+
+CSV_HEADER = [
+    "FechaDescarga", "Barrio", "Valor",
+    "NumHabitaciones", "NumBanos", "mts2",
+    "ValorCOP", "Habitaciones", "Banos", "AreaM2", "PrecioM2"
+]
 
 
 def extract_property_data(soup):
@@ -31,54 +96,1034 @@ def extract_property_data(soup):
         return [barrio, valor, habitaciones, banos, mts2]
     except Exception as e:
         logger.error(f"⚠️ Error extrayendo datos: {e}")
-    return ["Desconocido", "0", "0", "0", "0"]
+    return list(EMPTY_ROW)
 
 
-def process_html_files():
-    """Descarga HTMLs de S3, extrae información y genera el CSV."""
-    today = datetime.datetime.today().strftime("%Y-%m-%d")
-    data = []
-    try:
-        response = s3_client.list_objects_v2(Bucket=S3_BUCKET_HTML)
-        objects = response.get("Contents", [])
-        if not objects:
-            logger.warning("❌ No se encontraron archivos HTML en S3.")
+class _StopScan(Exception):
+    pass
+
+
+class ListingScanner(HTMLParser):
+    """Escáner en streaming que solo recoge los ``div`` de interés.
+
+    No construye árbol: acumula el texto de ``#view-map__text``,
+    ``.prices-and-fees__price`` y los tres primeros
+    ``.details-item-value`` y se detiene en cuanto los tiene todos.
+    Cada campo se reserva al abrir su ``div`` (orden del documento, como
+    ``find``/``find_all``) y se rellena al cerrarlo, así que los ``div``
+    anidados no alteran el orden.
+    """
+
+    SKIP_TEXT = {"script", "style", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.barrio = None
+        self.valor = None
+        self.detalles = []  # None mientras el div sigue abierto
+        self._claimed = set()
+        self._depth = 0
+        self._open = []  # [(campo, hueco, profundidad, partes_de_texto)]
+        self._skip = 0
+
+    def _field(self, attrs):
+        """Reserva el campo que abre este ``div``: ``(campo, hueco)``."""
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        if attrs.get("id") == "view-map__text":
+            field = "barrio"
+        elif "prices-and-fees__price" in classes:
+            field = "valor"
+        elif "details-item-value" in classes and len(self.detalles) < 3:
+            self.detalles.append(None)
+            return "detalle", len(self.detalles) - 1
+        else:
+            return None
+        if field in self._claimed:
+            return None
+        self._claimed.add(field)
+        return field, None
+
+    def complete(self):
+        found = self.barrio is not None and self.valor is not None
+        return found and len(self.detalles) >= 3 and None not in self.detalles
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TEXT:
+            self._skip += 1
+        if tag != "div":
             return
-        for obj in objects:
-            file_key = obj["Key"]
-            logger.info(f"📥 Procesando archivo: {file_key}")
-            # Descargar HTML desde S3
+        self._depth += 1
+        claimed = self._field(attrs)
+        if claimed is not None:
+            self._open.append((*claimed, self._depth, []))
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TEXT and self._skip:
+            self._skip -= 1
+        if tag != "div" or not self._depth:
+            return
+        while self._open and self._open[-1][2] >= self._depth:
+            field, slot, _, parts = self._open.pop()
+            self._store(field, slot, "".join(parts).strip())
+        self._depth -= 1
+        if not self._open and self.complete():
+            raise _StopScan
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        for *_, parts in self._open:
+            parts.append(data)
+
+    def _store(self, field, slot, text):
+        if field == "detalle":
+            self.detalles[slot] = text
+        else:
+            setattr(self, field, text)
+
+    def row(self):
+        detalles = [d if d is not None else "0" for d in self.detalles]
+        detalles += ["0"] * (3 - len(detalles))
+        return [
+            self.barrio if self.barrio is not None else "Desconocido",
+            self.valor if self.valor is not None else "0",
+        ] + detalles
+
+
+def scan_property_data(html_content):
+    """Ruta rápida. Devuelve ``(fila, completa)`` sin construir el árbol."""
+    scanner = ListingScanner()
+    try:
+        scanner.feed(html_content)
+        scanner.close()
+    except _StopScan:
+        pass
+    return scanner.row(), scanner.complete()
+
+
+def _extract_full(html_content):
+    # bs4 solo se importa si alguna página necesita el árbol completo
+    from bs4 import BeautifulSoup
+
+    return extract_property_data(BeautifulSoup(html_content, "html.parser"))
+
+
+def _extract_fast(html_content):
+    try:
+        row, complete = scan_property_data(html_content)
+    except Exception as e:
+        logger.warning(f"⚠️ Escáner rápido falló, se usa el árbol: {e}")
+        complete = False
+    # Páginas incompletas o raras se resuelven con el parser completo
+    return row if complete else _extract_full(html_content)
+
+
+def _extract_verify(html_content):
+    row = _extract_full(html_content)
+    fast_row, _ = scan_property_data(html_content)
+    if fast_row != row:
+        logger.warning(f"⚠️ Diferencia entre extractores: {fast_row} != {row}")
+    return row
+
+
+EXTRACTORS = {
+    "fast": _extract_fast,
+    "full": _extract_full,
+    "verify": _extract_verify,
+}
+
+
+def extract_from_html(html_content, engine=None):
+    """Extrae la fila de un HTML con el motor configurado."""
+    return EXTRACTORS[engine or EXTRACTOR_ENGINE](html_content)
+
+
+def diff_extractors(pages):
+    """Modo diferencial: compara escáner y árbol completo en un corpus.
+
+    ``pages`` es un dict ``{nombre: html}``. Devuelve
+    ``{nombre: (fila_rapida, fila_completa)}`` solo para las diferencias.
+    """
+    diffs = {}
+    for name, html_content in pages.items():
+        fast_row, _ = scan_property_data(html_content)
+        full_row = _extract_full(html_content)
+        if fast_row != full_row:
+            diffs[name] = (fast_row, full_row)
+    return diffs
+
+
+# Número con miles agrupados por el mismo separador ("335.000.000" o
+# "250,000,000") y decimales opcionales con el otro, o sin agrupar ("41,5")
+_NUMBER = re.compile(
+    r"\d{1,3}([.,])\d{3}(?:\1\d{3})*(?:[.,]\d+)?|\d+(?:[.,]\d+)?")
+# Relleno de los extractores cuando falta un campo (ver EMPTY_ROW)
+_PADDING = "0"
+_MILLONES = re.compile(r"\s*(?:millones|millón|millon)", re.IGNORECASE)
+_DETAIL_KINDS = (
+    ("mts2", re.compile(r"m²|m2\b|mts", re.IGNORECASE)),
+    ("banos", re.compile(r"baño|bano", re.IGNORECASE)),
+    ("habitaciones", re.compile(r"habitaci|alcoba", re.IGNORECASE)),
+)
+
+
+def parse_number(text):
+    """``"$ 335.000.000"`` -> ``335000000.0``; ``None`` si no hay número.
+
+    Acepta miles con punto o con coma: ``"$ 250,000,000"`` también da
+    ``250000000.0`` en vez de truncarse a 250.
+    """
+    match = _NUMBER.search(text or "")
+    if not match:
+        return None
+    number, thousands = match.group(), match.group(1)
+    if thousands:
+        number = number.replace(thousands, "")
+    value = float(number.replace(",", "."))
+    if _MILLONES.match(text, match.end()):
+        value *= 1_000_000
+    return value
+
+
+def normalize_row(row):
+    """Campos numéricos de una fila cruda ``[barrio, valor, *detalles]``.
+
+    Cada detalle se asigna por su unidad ("41 m²", "2 baños") y, si no la
+    tiene, por su posición. El ``"0"`` de relleno cuenta como dato ausente
+    en todos los campos.
+    """
+    _, valor, *detalles = row
+    texts = {}
+    for position, text in zip(("habitaciones", "banos", "mts2"), detalles):
+        if text.strip() == _PADDING:
+            continue
+        kind = next(
+            (k for k, pattern in _DETAIL_KINDS if pattern.search(text)),
+            position)
+        texts.setdefault(kind, text)
+    valor = parse_number(valor)
+    valor = int(valor) if valor else None
+    mts2 = parse_number(texts.get("mts2")) or None
+    habitaciones = parse_number(texts.get("habitaciones"))
+    banos = parse_number(texts.get("banos"))
+    return {
+        "valor": valor,
+        "habitaciones": None if habitaciones is None else int(habitaciones),
+        "banos": None if banos is None else int(banos),
+        "mts2": mts2,
+        "precio_m2": round(valor / mts2) if valor and mts2 else None,
+    }
+
+
+def csv_row(day, row):
+    """Fila del CSV: fecha, campos crudos y sus columnas numéricas."""
+    values = normalize_row(row)
+    return [day] + row + [values[field] for field in TYPED_FIELDS]
+
+
+def _day_from_key(file_key):
+    """Día de descarga a partir de la clave ``YYYY-MM-DD/...`` del HTML."""
+    prefix = file_key.split("/", 1)[0]
+    try:
+        datetime.datetime.strptime(prefix, "%Y-%m-%d")
+        return prefix
+    except ValueError:
+        return datetime.datetime.today().strftime("%Y-%m-%d")
+
+
+def _error_code(error):
+    return error.response.get("Error", {}).get("Code")
+
+
+def load_checkpoint(day):
+    """Lee el checkpoint del día. Devuelve ``(estado, etag)``."""
+    try:
+        with metrics.timer("checkpoint_get"):
+            obj = s3_client.get_object(
+                Bucket=CHECKPOINT_BUCKET,
+                Key=f"{CHECKPOINT_PREFIX}/{day}.json")
+    except ClientError as e:
+        if _error_code(e) in ("NoSuchKey", "404"):
+            return {}, None
+        raise
+    return json.loads(obj["Body"].read()), obj["ETag"]
+
+
+def save_checkpoint(day, state, etag):
+    """Guarda el checkpoint solo si nadie lo modificó desde ``etag``.
+
+    Devuelve el ETag de la nueva versión, o ``None`` si otra invocación lo
+    escribió antes (HTTP 412).
+    """
+    condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    try:
+        with metrics.timer("checkpoint_put"):
+            response = s3_client.put_object(
+                Bucket=CHECKPOINT_BUCKET,
+                Key=f"{CHECKPOINT_PREFIX}/{day}.json",
+                Body=json.dumps(state, ensure_ascii=False).encode("utf-8"),
+                ContentType="application/json",
+                **condition,
+            )
+    except ClientError as e:
+        if _error_code(e) in CONFLICT_CODES:
+            metrics.count("checkpoint_conflicts")
+            return None
+        raise
+    return response["ETag"]
+
+
+def _pending_prefix(day):
+    return f"{PENDING_PREFIX}/{day}/"
+
+
+def save_pending(day, entries):
+    """Guarda las filas nuevas ``{id: {"etag", "row"}}`` en un lote propio.
+
+    La clave es única (instante de escritura + sufijo aleatorio), así que
+    esta escritura nunca compite con otras invocaciones; el orden de las
+    claves es el orden en que se aplican los lotes. Devuelve la clave.
+    """
+    key = (f"{_pending_prefix(day)}{time.time_ns():020d}-"
+           f"{os.urandom(6).hex()}.json")
+    s3_client.put_object(
+        Bucket=CHECKPOINT_BUCKET,
+        Key=key,
+        Body=json.dumps(entries, ensure_ascii=False).encode("utf-8"),
+        ContentType="application/json",
+    )
+    return key
+
+
+def list_pending(day):
+    """Claves de los lotes pendientes del día, en orden de escritura."""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    keys = []
+    for page in paginator.paginate(
+            Bucket=CHECKPOINT_BUCKET, Prefix=_pending_prefix(day)):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return sorted(keys)
+
+
+def _load_pending(key):
+    try:
+        obj = s3_client.get_object(Bucket=CHECKPOINT_BUCKET, Key=key)
+    except ClientError as e:
+        # Otra invocación ya lo fusionó en un checkpoint guardado y lo borró
+        if _error_code(e) in ("NoSuchKey", "404"):
+            return None
+        raise
+    return json.loads(obj["Body"].read())
+
+
+def delete_pending(keys):
+    """Borra lotes ya fusionados en un checkpoint guardado."""
+    for i in range(0, len(keys), 1000):
+        s3_client.delete_objects(
+            Bucket=CHECKPOINT_BUCKET,
+            Delete={"Objects": [{"Key": key} for key in keys[i:i + 1000]],
+                    "Quiet": True},
+        )
+
+
+def merge_pending(state, keys, barrios, known=None):
+    """Aplica sobre ``state`` los lotes ``keys`` en orden de escritura.
+
+    ``known`` (``{clave: filas}``) evita releer los lotes que ya están en
+    memoria. Los barrios de las filas reemplazadas y nuevas se añaden a
+    ``barrios``.
+    """
+    known = known or {}
+    missing = [key for key in keys if key not in known]
+    if missing:
+        with ThreadPoolExecutor(READ_WORKERS) as pool:
+            known = {**known,
+                     **dict(zip(missing, pool.map(_load_pending, missing)))}
+    for key in keys:
+        for item, entry in (known[key] or {}).items():
+            if item in state:
+                barrios.add(state[item]["row"][0])
+            state[item] = entry
+            barrios.add(entry["row"][0])
+
+
+def _content_hash(file_key):
+    """SHA-256 de un HTML direccionado por contenido, o ``None``."""
+    if file_key.startswith(CONTENT_PREFIX) and file_key.endswith(".html.gz"):
+        return file_key.rsplit("/", 1)[1][:-len(".html.gz")]
+    return None
+
+
+def load_cached_row(sha256):
+    """Fila ya extraída para un contenido, o ``None`` si nunca se parseó."""
+    try:
+        obj = s3_client.get_object(
+            Bucket=CHECKPOINT_BUCKET, Key=f"{ROWS_PREFIX}/{sha256}.json")
+    except ClientError as e:
+        if _error_code(e) in ("NoSuchKey", "404"):
+            return None
+        raise
+    return json.loads(obj["Body"].read())
+
+
+def save_cached_row(sha256, row):
+    s3_client.put_object(
+        Bucket=CHECKPOINT_BUCKET,
+        Key=f"{ROWS_PREFIX}/{sha256}.json",
+        Body=json.dumps(row, ensure_ascii=False).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+
+def _parse_html_bytes(body, engine):
+    """Tarea de parseo (a nivel de módulo para poder usarla en procesos)."""
+    return extract_from_html(body.decode("utf-8"), engine)
+
+
+def _parse_worker(conn):
+    """Bucle de un proceso parseador.
+
+    Recibe ``(body, engine)`` por su extremo del ``Pipe`` y responde
+    ``(ok, fila_o_excepción)``; ``None`` lo termina.
+    """
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        try:
+            conn.send((True, _parse_html_bytes(*task)))
+        except Exception as e:
+            conn.send((False, e))
+    conn.close()
+
+
+class PipeParserPool:
+    """Procesos parseadores conectados cada uno por un ``Pipe``.
+
+    ``ProcessPoolExecutor`` y las colas de ``multiprocessing`` necesitan
+    semáforos en ``/dev/shm``, que Lambda no tiene; ``Process`` y ``Pipe``
+    solo usan un socket por proceso y sí funcionan allí. Cada hilo lector
+    toma un proceso libre, le envía el HTML y espera su fila. Si un proceso
+    muere se retira y, sin ninguno vivo, se parsea en el propio hilo.
+    """
+
+    def __init__(self, workers):
+        import multiprocessing
+        import queue
+
+        self._empty = queue.Empty
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._alive = workers
+        self._processes = []
+        for _ in range(workers):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_parse_worker, args=(child,), daemon=True)
+            process.start()
+            child.close()
+            self._processes.append((process, parent))
+            self._idle.put(parent)
+
+    def _acquire(self):
+        while self._alive:
+            try:
+                return self._idle.get(timeout=0.1)
+            except self._empty:
+                continue
+        return None
+
+    def parse(self, body, engine):
+        conn = self._acquire()
+        if conn is None:
+            return _parse_html_bytes(body, engine)
+        try:
+            conn.send((body, engine))
+            ok, result = conn.recv()
+        except (EOFError, OSError) as e:
+            with self._lock:
+                self._alive -= 1
+            logger.warning(f"⚠️ Proceso parseador caído, se retira: {e}")
+            return _parse_html_bytes(body, engine)
+        self._idle.put(conn)
+        if not ok:
+            raise result
+        return result
+
+    def shutdown(self):
+        for process, conn in self._processes:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+
+
+def _parser_pool(workers):
+    """Procesos parseadores, o ``None`` para parsear en los hilos lectores.
+
+    Con una sola vCPU los procesos no aportan nada y se usan los hilos.
+    """
+    if workers <= 1:
+        return None
+    try:
+        return PipeParserPool(workers)
+    except (OSError, ImportError) as e:
+        logger.warning(f"⚠️ Sin procesos parseadores, se usan hilos: {e}")
+        return None
+
+
+def _read_and_parse(file_key, parsers):
+    """Etapa de un hilo lector: descarga el HTML y espera su parseo.
+
+    Los fallos de un objeto concreto (lectura cortada, gzip corrupto, HTML
+    que no es UTF-8...) se registran y devuelven ``(key, None, None)``
+    para no perder las filas ya parseadas del resto del día.
+    """
+    logger.info(f"📥 Procesando archivo: {file_key}")
+    try:
+        with metrics.timer("s3_get"):
             file_obj = s3_client.get_object(
                 Bucket=S3_BUCKET_HTML, Key=file_key)
-            html_content = file_obj["Body"].read().decode("utf-8")
-            soup = BeautifulSoup(html_content, "html.parser")
-            extracted_data = extract_property_data(soup)
-            data.append([today] + extracted_data)
-        if data:
-            # Crear CSV en memoria
-            csv_buffer = io.StringIO()
-            csv_writer = csv.writer(csv_buffer)
-            csv_writer.writerow([
-                "FechaDescarga", "Barrio", "Valor",
-                "NumHabitaciones", "NumBanos", "mts2"
-            ])
-            csv_writer.writerows(data)
-            # Guardar CSV en S3
-            csv_file = f"{today}.csv"
-            s3_client.put_object(
-                Bucket=S3_BUCKET_CSV,
-                Key=f"{today}/{csv_file}",
-                Body=csv_buffer.getvalue().encode("utf-8"),
-                ContentType="text/csv"
-            )
-            logger.info(f"✅ Guardado CSV en {S3_BUCKET_CSV}: {csv_file}")
+            body = file_obj["Body"].read()
+    except (BotoCoreError, ClientError) as e:
+        metrics.count("s3_errors")
+        logger.error(f"❌ Error leyendo {file_key}: {e}")
+        return file_key, None, None
+    metrics.count("pages")
+    metrics.count("bytes_read", len(body))
+    metrics.observe("page_bytes", len(body))
+    try:
+        if file_key.endswith(".gz"):
+            body = gzip.decompress(body)
+        # Con procesos parseadores incluye esperar a que uno quede libre
+        with metrics.timer("parse"):
+            if parsers is None:
+                row = _parse_html_bytes(body, EXTRACTOR_ENGINE)
+            else:
+                row = parsers.parse(body, EXTRACTOR_ENGINE)
+    except Exception as e:
+        metrics.count("parse_errors")
+        logger.error(f"❌ Error parseando {file_key}: {e!r}")
+        return file_key, None, None
+    if row == EMPTY_ROW:
+        metrics.count("parse_failures")
+    etag = _content_hash(file_key) or file_obj["ETag"].strip('"')
+    return file_key, etag, row
+
+
+def fetch_and_parse(file_keys, read_workers=READ_WORKERS,
+                    parse_workers=PARSE_WORKERS):
+    """Descarga y parsea en paralelo, entregando ``(key, etag, fila)``.
+
+    Cada hilo lector retiene como mucho un HTML mientras se parsea y la
+    ventana de tareas pendientes está acotada, así que los HTMLs en vuelo
+    no crecen con el número de objetos (las filas entregadas sí las
+    conserva quien las consume, ver ``process_day``). Los objetos que no
+    se pudieron leer llegan con ``etag`` y ``fila`` a ``None``.
+
+    Los procesos parseadores solo se arrancan si hay más objetos que hilos
+    lectores: para un evento con una clave (o ninguna) crearlos cuesta más
+    que parsear en el propio hilo.
+    """
+    file_keys = list(file_keys)
+    if not file_keys:
+        return
+    parsers = None
+    if len(file_keys) > read_workers:
+        parsers = _parser_pool(parse_workers)
+    try:
+        with ThreadPoolExecutor(read_workers) as readers:
+            window = deque()
+            for file_key in file_keys:
+                window.append(
+                    readers.submit(_read_and_parse, file_key, parsers))
+                if len(window) >= 2 * read_workers:
+                    yield window.popleft().result()
+            while window:
+                yield window.popleft().result()
+    finally:
+        if parsers is not None:
+            parsers.shutdown()
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """Archivo de solo escritura que sube a S3 por partes mientras se escribe.
+
+    Nunca retiene más de ``part_size`` bytes. Si el total no llega a una
+    parte se usa un único ``put_object``. Al salir del ``with`` con una
+    excepción la subida se aborta en lugar de completarse.
+    """
+
+    def __init__(self, bucket, key, content_type,
+                 part_size=MULTIPART_PART_SIZE):
+        super().__init__()
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = part_size
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed S3MultipartWriter")
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(self.part_size)
+        return len(data)
+
+    def _upload_part(self, size):
+        if self._upload_id is None:
+            self._upload_id = s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key,
+                ContentType=self.content_type)["UploadId"]
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        number = len(self._parts) + 1
+        with metrics.timer("s3_put"):
+            response = s3_client.upload_part(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                PartNumber=number, Body=chunk)
+        self._parts.append({"ETag": response["ETag"], "PartNumber": number})
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                with metrics.timer("s3_put"):
+                    s3_client.put_object(
+                        Bucket=self.bucket, Key=self.key,
+                        Body=bytes(self._buffer),
+                        ContentType=self.content_type)
+            else:
+                if self._buffer:
+                    self._upload_part(len(self._buffer))
+                s3_client.complete_multipart_upload(
+                    Bucket=self.bucket, Key=self.key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={"Parts": self._parts})
+        except Exception:
+            self.abort()
+            raise
+        super().close()
+
+    def abort(self):
+        """Descarta la subida en curso sin crear el objeto."""
+        if self.closed:
+            return
+        if self._upload_id is not None:
+            s3_client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        self._buffer.clear()
+        super().close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
         else:
-            logger.warning("⚠️ No se extrajeron datos, no se generará el CSV.")
-    except boto3.exceptions.Boto3Error as e:
+            self.close()
+
+
+def stream_csv(key, rows, compression=None):
+    """Escribe ``rows`` como CSV en S3 en streaming, sin armarlo en memoria.
+
+    Devuelve la clave final (con ``.gz`` si se comprime).
+    """
+    compress = (compression or CSV_COMPRESSION) == "gzip"
+    if compress:
+        key += ".gz"
+    content_type = "application/gzip" if compress else "text/csv"
+    with metrics.timer("csv_write"), \
+            S3MultipartWriter(S3_BUCKET_CSV, key, content_type) as raw:
+        gz = None
+        if compress:
+            gz = gzip.GzipFile(fileobj=raw, mode="wb", mtime=0)
+        text = io.TextIOWrapper(gz or raw, encoding="utf-8", newline="")
+        csv_writer = csv.writer(text)
+        csv_writer.writerow(CSV_HEADER)
+        csv_writer.writerows(rows)
+        text.flush()
+        text.detach()
+        if gz is not None:
+            gz.close()
+    metrics.count("bytes_written", raw.bytes_written)
+    return key
+
+
+def barrio_slug(barrio):
+    """Nombre de partición para S3: ``"Bogotá, D.C."`` -> ``bogota-d-c``."""
+    text = unicodedata.normalize("NFKD", barrio)
+    text = text.encode("ascii", "ignore").decode("ascii").lower()
+    return re.sub(r"[^a-z0-9]+", "-", text).strip("-") or "desconocido"
+
+
+def write_day_csv(day, state):
+    """Genera el CSV del día a partir de las filas del checkpoint."""
+    rows = (csv_row(day, state[key]["row"]) for key in sorted(state))
+    csv_file = stream_csv(f"{day}/{day}.csv", rows)
+    logger.info(f"✅ Guardado CSV en {S3_BUCKET_CSV}: {csv_file}")
+
+
+def write_day_partitions(day, state, barrios=None):
+    """Escribe ``{day}/barrio=<slug>/part.csv`` y el manifiesto del día.
+
+    Solo se reescriben las particiones de ``barrios`` (todas si es
+    ``None``); el manifiesto siempre se regenera desde el checkpoint.
+    """
+    partitions = {}
+    for key in sorted(state):
+        row = state[key]["row"]
+        partitions.setdefault(barrio_slug(row[0]), []).append(
+            csv_row(day, row))
+    touched = None if barrios is None else {barrio_slug(b) for b in barrios}
+
+    manifest = {"day": day, "columns": CSV_HEADER, "partitions": []}
+    suffix = ".gz" if CSV_COMPRESSION == "gzip" else ""
+    for slug in sorted(partitions):
+        key = f"{day}/barrio={slug}/part.csv"
+        if touched is None or slug in touched:
+            key = stream_csv(key, partitions[slug])
+        else:
+            key += suffix
+        manifest["partitions"].append({
+            "barrio": partitions[slug][0][1],
+            "key": key,
+            "rows": len(partitions[slug]),
+        })
+    # Particiones que quedaron vacías tras reprocesar un HTML
+    for slug in (touched or set()) - set(partitions):
+        s3_client.delete_object(
+            Bucket=S3_BUCKET_CSV, Key=f"{day}/barrio={slug}/part.csv{suffix}")
+    s3_client.put_object(
+        Bucket=S3_BUCKET_CSV,
+        Key=f"{day}/_manifest.json",
+        Body=json.dumps(manifest, ensure_ascii=False).encode("utf-8"),
+        ContentType="application/json",
+    )
+    logger.info(f"✅ Guardadas {len(partitions)} particiones de {day}")
+
+
+def _aggregates_key(day):
+    return f"{AGGREGATES_PREFIX}/{day}.json"
+
+
+def write_day_aggregates(day, state):
+    """Guarda el resumen por barrio del día (conteo, suma, min/max, sketch).
+
+    Se recalcula desde las filas del checkpoint, que ya están en memoria:
+    así un HTML reprocesado reemplaza su valor anterior en vez de sumarse.
+    """
+    with metrics.timer("aggregates"):
+        summaries = aggregates.summarize(
+            (entry["row"][0], normalize_row(entry["row"]))
+            for entry in state.values())
+        body = json.dumps(
+            aggregates.dump(day, summaries), ensure_ascii=False,
+            separators=(",", ":")).encode("utf-8")
+        s3_client.put_object(
+            Bucket=S3_BUCKET_CSV,
+            Key=_aggregates_key(day),
+            Body=body,
+            ContentType="application/json",
+        )
+    metrics.count("aggregate_bytes", len(body))
+    logger.info(f"📊 Agregados de {day}: {len(summaries)} barrios")
+
+
+def load_day_aggregates(day):
+    """``{barrio: {campo: Summary}}`` del día, vacío si no hay agregados."""
+    try:
+        obj = s3_client.get_object(
+            Bucket=S3_BUCKET_CSV, Key=_aggregates_key(day))
+    except ClientError as e:
+        if _error_code(e) in ("NoSuchKey", "404"):
+            return {}
+        raise
+    return aggregates.load(json.loads(obj["Body"].read()))
+
+
+def query_aggregates(days, field="precio_m2", quantiles=(0.5,)):
+    """Estadísticas por barrio de ``field`` en un rango de días.
+
+    Solo lee un JSON pequeño por día, p. ej. la mediana del precio por m²
+    de la semana::
+
+        query_aggregates(["2025-01-01", ..., "2025-01-07"])
+    """
+    merged = aggregates.merge(load_day_aggregates(day) for day in days)
+    result = {}
+    for barrio, fields in sorted(merged.items()):
+        summary = fields[field]
+        if not summary.count:
+            continue
+        stats = {
+            "count": summary.count,
+            "mean": summary.mean,
+            "min": summary.minimum,
+            "max": summary.maximum,
+        }
+        stats.update(
+            (f"p{round(q * 100)}", summary.quantile(q)) for q in quantiles)
+        result[barrio] = stats
+    return result
+
+
+def write_outputs(day, state, barrios=None):
+    """Escribe la salida del día según ``OUTPUT_LAYOUT`` y sus agregados."""
+    if OUTPUT_LAYOUT in ("daily", "both"):
+        write_day_csv(day, state)
+    if OUTPUT_LAYOUT in ("partitioned", "both"):
+        write_day_partitions(day, state, barrios)
+    write_day_aggregates(day, state)
+
+
+def process_day(day, objects, sources=None):
+    """Procesa de forma incremental los HTMLs ``{id: etag}`` de un día.
+
+    ``id`` es la clave del HTML en S3 o, con ``sources`` (``{id: clave}``),
+    la URL del inmueble cuyo HTML está en esa clave. Solo se descargan y
+    parsean los ids cuyo ETag no está ya en el checkpoint; las filas nuevas
+    se fusionan con las existentes y el CSV del día se regenera a partir de
+    ellas. Para HTMLs direccionados por contenido se reutiliza la fila de
+    ese hash si ya se extrajo otro día, y cada contenido se parsea una sola
+    vez aunque lo compartan varios inmuebles.
+    Devuelve cuántas filas nuevas se incorporaron.
+
+    Memoria: el checkpoint del día se mantiene entero en memoria porque las
+    salidas se regeneran desde él. Cuesta ~1 KB por fila retenida y ~1,4 KB
+    de pico al serializarlo (tracemalloc, backfill de 20k objetos), es
+    decir, crece linealmente con las filas del día.
+    """
+    sources = sources or {}
+    state, etag = load_checkpoint(day)
+    # Ids pendientes agrupados por el objeto S3 que contiene su HTML
+    by_key = {}
+    for item, obj_etag in objects.items():
+        if not obj_etag or state.get(item, {}).get("etag") != obj_etag:
+            by_key.setdefault(sources.get(item, item), []).append(item)
+
+    # Las filas van directamente al estado del día, sin copias intermedias;
+    # los ids que comparten contenido comparten también la entrada.
+    new_ids = []
+    barrios = set()
+
+    def store(file_key, new_etag, row):
+        entry = {"etag": new_etag, "row": row}
+        for item in by_key.pop(file_key):
+            if item in state:
+                barrios.add(state[item]["row"][0])
+            state[item] = entry
+            new_ids.append(item)
+        barrios.add(row[0])
+
+    hashed = [key for key in by_key if _content_hash(key)]
+    reused = 0
+    with ThreadPoolExecutor(READ_WORKERS) as pool:
+        hashes = [_content_hash(key) for key in hashed]
+        for file_key, sha256, row in zip(
+                hashed, hashes, pool.map(load_cached_row, hashes)):
+            if row is not None:
+                store(file_key, sha256, row)
+                reused += 1
+    if reused:
+        metrics.count("rows_reused", reused)
+        logger.info(f"♻️ {reused} filas reutilizadas por hash.")
+
+    for file_key, new_etag, row in fetch_and_parse(list(by_key)):
+        if row is None:
+            continue
+        store(file_key, new_etag, row)
+        if _content_hash(file_key):
+            save_cached_row(new_etag, row)
+    by_key.clear()
+    if not new_ids:
+        logger.info(f"⏭️ Sin cambios para {day}.")
+        return 0
+
+    # Muchas invocaciones del mismo día pueden llegar a la vez. Las filas
+    # nuevas se guardan primero en un lote propio, sin competir, y quien
+    # consigue guardar el checkpoint fusiona después los lotes pendientes.
+    # Si otra invocación guarda antes, esta relee y reintenta una vez: como
+    # esa lectura es posterior a su lote, quien le gane después lo verá al
+    # volver a listar, así que puede terminar sin perder filas ni fallar.
+    mine = {item: state[item] for item in new_ids}
+    keys = [save_pending(day, mine)]
+    saved = save_checkpoint(day, state, etag)
+    if not saved:
+        state, etag = load_checkpoint(day)
+        barrios = set()
+        merge_pending(state, keys, barrios, {keys[0]: mine})
+        saved = save_checkpoint(day, state, etag)
+    del mine
+    if not saved:
+        metrics.count("checkpoint_handoffs")
+        logger.info(f"🤝 Otra invocación fusionará las filas de {day}.")
+        return len(new_ids)
+
+    # Quien guarda borra lo fusionado y recoge los lotes que llegaron
+    # mientras tanto, hasta que no quedan o le gana otra invocación.
+    while saved:
+        etag = saved
+        delete_pending(keys)
+        keys = list_pending(day)
+        if not keys:
+            break
+        merge_pending(state, keys, barrios)
+        saved = save_checkpoint(day, state, etag)
+    publish_outputs(day, state, etag, barrios)
+    return len(new_ids)
+
+
+def _changed_barrios(old, new):
+    """Barrios con alguna fila distinta entre dos versiones del checkpoint."""
+    barrios = set()
+    for key in old.keys() | new.keys():
+        before, after = old.get(key), new.get(key)
+        if before != after:
+            barrios.update(e["row"][0] for e in (before, after) if e)
+    return barrios
+
+
+def publish_outputs(day, state, etag, barrios=None):
+    """Escribe las salidas de la versión ``etag`` del checkpoint.
+
+    Las salidas no son condicionales y gana la última escritura: si otra
+    invocación guardó una versión más nueva mientras se escribían, se
+    regeneran desde ella para no dejar publicadas filas viejas.
+    """
+    for _ in range(CHECKPOINT_RETRIES):
+        write_outputs(day, state, barrios)
+        latest, latest_etag = load_checkpoint(day)
+        if latest_etag == etag:
+            return
+        metrics.count("outputs_rewritten")
+        barrios = _changed_barrios(state, latest)
+        state, etag = latest, latest_etag
+    logger.warning(f"⚠️ El checkpoint de {day} sigue cambiando; la última "
+                   "invocación que lo guardó publicará sus salidas.")
+
+
+def _group_by_day(objects):
+    days = {}
+    for file_key, obj_etag in objects:
+        days.setdefault(_day_from_key(file_key), {})[file_key] = obj_etag
+    return days
+
+
+def _is_index(file_key):
+    return file_key.endswith(f"/{INDEX_FILE}")
+
+
+def process_index(index_key):
+    """Procesa el índice diario de HTMLs direccionados por contenido.
+
+    El checkpoint se indexa por URL con el hash como ETag: inmuebles
+    distintos con el mismo HTML siguen siendo filas distintas del día.
+    """
+    obj = s3_client.get_object(Bucket=S3_BUCKET_HTML, Key=index_key)
+    index = json.loads(obj["Body"].read())
+    listings = index["listings"]
+    objects = {entry["url"]: entry["sha256"] for entry in listings}
+    sources = {entry["url"]: entry["key"] for entry in listings}
+    return process_day(index["day"], objects, sources)
+
+
+def process_event(event):
+    """Procesa solo las claves indicadas en los registros S3 del evento."""
+    objects = []
+    total = 0
+    for record in event.get("Records", []):
+        s3_object = record.get("s3", {}).get("object", {})
+        file_key = unquote_plus(s3_object.get("key", ""))
+        if file_key.endswith(".html"):
+            objects.append((file_key, s3_object.get("eTag")))
+        elif _is_index(file_key):
+            total += process_index(file_key)
+    for day, day_objects in _group_by_day(objects).items():
+        total += process_day(day, day_objects)
+    return total
+
+
+def iter_html_objects(prefix=""):
+    """Recorre paginando los HTMLs e índices diarios del bucket de entrada.
+
+    Los objetos por contenido no se listan: se llega a ellos por su índice.
+    """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET_HTML, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(".html") or _is_index(obj["Key"]):
+                yield obj["Key"], obj["ETag"].strip('"')
+
+
+def process_html_files(prefix=""):
+    """Backfill: recorre el bucket completo (o un prefijo) y genera los CSVs.
+
+    Gracias al checkpoint, los HTMLs ya procesados no se vuelven a parsear.
+    """
+    total = 0
+    try:
+        objects = list(iter_html_objects(prefix))
+        if not objects:
+            logger.warning("❌ No se encontraron archivos HTML en S3.")
+            return 0
+        indexes = sorted(key for key, _ in objects if _is_index(key))
+        days = _group_by_day(
+            item for item in objects if not _is_index(item[0]))
+        for day in sorted(days):
+            total += process_day(day, days[day])
+        for index_key in indexes:
+            total += process_index(index_key)
+    except (BotoCoreError, ClientError) as e:
         logger.error(f"❌ Error con S3: {e}")
+    return total
+
 
+def rebuild_aggregates(prefix=""):
+    """Regenera los agregados de los días ya procesados desde sus checkpoints.
 
+    Sirve para el histórico anterior a los agregados; no lee HTMLs ni CSVs.
+    """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    prefix = f"{CHECKPOINT_PREFIX}/{prefix.rstrip('/')}"
+    days = []
+    for page in paginator.paginate(Bucket=CHECKPOINT_BUCKET, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            name = obj["Key"].rsplit("/", 1)[1]
+            if name.endswith(".json"):
+                days.append(name[:-len(".json")])
+    for day in days:
+        state, _ = load_checkpoint(day)
+        write_day_aggregates(day, state)
+    return len(days)
+
+
+@metrics.instrument
 def lambda_handler(event, context):
-    """Manejador principal para AWS Lambda."""
-    process_html_files()
+    """Manejador principal para AWS Lambda.
+
+    Con un evento ``s3:ObjectCreated`` procesa solo los objetos nuevos; sin
+    registros (invocación manual) hace un backfill, opcionalmente limitado
+    con ``{"prefix": "YYYY-MM-DD/"}``. ``{"rebuild_aggregates": true}``
+    solo regenera los agregados diarios desde los checkpoints.
+    """
+    event = event or {}
+    if event.get("Records"):
+        process_event(event)
+    elif event.get("rebuild_aggregates"):
+        rebuild_aggregates(event.get("prefix", ""))
+    else:
+        process_html_files(event.get("prefix", ""))
     return {"statusCode": 200, "body": "HTMLs completado y CSV generado"}
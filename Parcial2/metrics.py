@@ -0,0 +1 @@
+../Parcial1/metrics.py
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""S3 en memoria compartido por las pruebas y el benchmark offline.
+
+Implementa lo mínimo que usan las Lambdas: escrituras condicionales
+(``IfMatch``/``IfNoneMatch``), subidas por partes y paginación de 1000
+claves como ``list_objects_v2``.
+"""
+import hashlib
+import io
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+
+class FakeS3:
+    """Cliente S3 en memoria, seguro entre hilos, que cuenta los bytes.
+
+    Los buckets de ``sink_buckets`` solo guardan tamaño y ETag (no el
+    cuerpo) para no medir la memoria del propio fake. ``add_virtual``
+    registra objetos cuyo cuerpo se genera al leerlos. ``latency`` añade
+    una espera a cada llamada para simular la red en pruebas de
+    concurrencia, y ``gets`` guarda las claves leídas en orden.
+    """
+
+    def __init__(self, sink_buckets=(), latency=0.0):
+        self.objects = {}
+        self.gets = []
+        self.latency = latency
+        self.virtual = {}
+        self.sink_buckets = set(sink_buckets)
+        self.uploads = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def _network(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _count(self, name, bytes_in=0, bytes_out=0):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    @staticmethod
+    def _error(code, operation):
+        return ClientError({"Error": {"Code": code}}, operation)
+
+    def add_virtual(self, bucket, keys, body_fn):
+        for key in keys:
+            self.virtual[(bucket, key)] = body_fn
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None,
+                   **kwargs):
+        self._network()
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        with self._lock:
+            current = self.objects.get((Bucket, Key))
+            current_etag = current[1] if current else None
+            if (IfNoneMatch == "*" and current) or (
+                    IfMatch is not None and IfMatch != current_etag):
+                raise self._error("PreconditionFailed", "PutObject")
+            stored = None if Bucket in self.sink_buckets else Body
+            self.objects[(Bucket, Key)] = (stored, etag, len(Body))
+        self._count("PutObject", bytes_in=len(Body))
+        return {"ETag": etag}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._network()
+        with self._lock:
+            self.gets.append(Key)
+            current = self.objects.get((Bucket, Key))
+        if current is not None and current[0] is not None:
+            body, etag = current[0], current[1]
+        elif (Bucket, Key) in self.virtual:
+            body = self.virtual[(Bucket, Key)](Key).encode("utf-8")
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+        else:
+            raise self._error("NoSuchKey", "GetObject")
+        self._count("GetObject", bytes_out=len(body))
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+    def delete_object(self, Bucket, Key):
+        self._network()
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+        self._count("DeleteObject")
+
+    def delete_objects(self, Bucket, Delete):
+        self._network()
+        with self._lock:
+            for obj in Delete["Objects"]:
+                self.objects.pop((Bucket, obj["Key"]), None)
+        self._count("DeleteObjects")
+        return {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        with self._lock:
+            upload_id = f"upload-{len(self.uploads)}-{Key}"
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        self._count("UploadPart", bytes_in=len(Body))
+        return {"ETag": f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId,
+                                  MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        body = b"".join(
+            parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+        stored = None if Bucket in self.sink_buckets else body
+        etag = f'"{hashlib.md5(body).hexdigest()}-{len(parts)}"'
+        with self._lock:
+            self.objects[(Bucket, Key)] = (stored, etag, len(body))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+    def get_paginator(self, name):
+        fake = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix=""):
+                with fake._lock:
+                    keys = {key: entry[1]
+                            for (bucket, key), entry in fake.objects.items()
+                            if bucket == Bucket}
+                for bucket, key in fake.virtual:
+                    if bucket == Bucket:
+                        keys.setdefault(key, '"virtual"')
+                contents = [{"Key": key, "ETag": keys[key]}
+                            for key in sorted(keys) if key.startswith(Prefix)]
+                for i in range(0, max(len(contents), 1), 1000):
+                    fake._network()
+                    fake._count("ListObjectsV2")
+                    yield {"Contents": contents[i:i + 1000]}
+
+        return Paginator()
@@ -0,0 +1,353 @@
+"""Benchmark offline de las dos Lambdas, sin AWS ni mitula.com.co.
+
+Levanta un servidor HTTP local con páginas de búsqueda e inmuebles
+sintéticas y sustituye ``s3_client`` de cada módulo por un S3 en memoria.
+Luego ejecuta ``lambda_handler`` de Parcial1 y Parcial2 y mide
+páginas/s, latencia p50/p99 por página, RSS máximo y bytes transferidos.
+
+Uso::
+
+    python bench/harness.py                      # escalas 10, 1000, 100000
+    python bench/harness.py --scales 10 1000 --check
+    python bench/harness.py --scales 10 1000 --save-baseline
+
+Cada escenario corre en un subproceso para que el RSS máximo sea suyo.
+``baselines.json`` se midió en una máquina de desarrollo y solo sirve para
+comparar en esa máquina. Para comparar en otra (p. ej. el runner de CI) se
+mide primero el código de referencia con ``BENCH_ROOT`` apuntando a su
+checkout y se guarda en otro archivo::
+
+    BENCH_ROOT=/tmp/base python bench/harness.py --scales 1000 \
+        --save-baseline --baseline-file /tmp/baselines.json
+    python bench/harness.py --scales 1000 --check \
+        --baseline-file /tmp/baselines.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Árbol cuyo Parcial1/Parcial2 se mide (por defecto, el de este archivo)
+ROOT = os.environ.get("BENCH_ROOT") or os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "Parcial1"), os.path.join(ROOT, "Parcial2")]
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import requests  # noqa: E402
+from fakes3 import FakeS3  # noqa: E402
+
+BASELINES_FILE = os.path.join(os.path.dirname(__file__), "baselines.json")
+DEFAULT_SCALES = (10, 1000, 100000)
+DAY = "2025-01-01"
+# Tolerancias antes de considerar una regresión frente al baseline
+MAX_THROUGHPUT_DROP = 0.25
+MAX_P99_INCREASE = 0.5
+MAX_RSS_INCREASE = 0.5
+# Con menos páginas las métricas son puro ruido y no se comparan
+MIN_PAGES_TO_COMPARE = 100
+
+BARRIOS = ["Chapinero", "Usaquén", "Suba", "Teusaquillo", "Kennedy",
+           "Engativá", "Fontibón", "Bosa", "La Candelaria", "Barrios Unidos"]
+
+
+def listing_html(listing_id, filler_kb=20):
+    """Página de inmueble sintética, determinista para cada ``listing_id``."""
+    rnd = random.Random(listing_id)
+    price = f"{rnd.randrange(80, 900) * 1_000_000:,}".replace(",", ".")
+    filler = "".join(
+        f'<div class="card"><a href="/otro/{i}">Relacionado {i}</a>'
+        f'<span>{"x" * 40}</span></div>'
+        for i in range(filler_kb * 1024 // 100))
+    return (
+        "<html><head><title>Inmueble</title>"
+        "<script>window.dataLayer = [];</script></head><body>"
+        f"<div class=\"header\">{filler[:len(filler) // 2]}</div>"
+        f'<div id="view-map__text">{rnd.choice(BARRIOS)}, Bogotá</div>'
+        f'<div class="prices-and-fees__price">$ {price}</div>'
+        '<div class="details">'
+        f'<div class="details-item-value">{rnd.randint(1, 4)} habitaciones'
+        "</div>"
+        f'<div class="details-item-value">{rnd.randint(1, 3)} baños</div>'
+        f'<div class="details-item-value">{rnd.randint(25, 140)} m²</div>'
+        f"</div>{filler[len(filler) // 2:]}</body></html>"
+    )
+
+
+def search_html(page, total, per_page):
+    start = (page - 1) * per_page
+    links = "".join(
+        f'<a href="/listing/mitula-CO-{i}">Inmueble {i}</a>'
+        for i in range(start, min(start + per_page, total)))
+    next_link = ""
+    if start + per_page < total:
+        next_link = f'<link rel="next" href="/find?page={page + 1}">'
+    return f"<html><head>{next_link}</head><body>{links}</body></html>"
+
+
+class MitulaStub:
+    """Servidor local que imita las páginas de búsqueda y de inmueble."""
+
+    def __init__(self, total, per_page=50, latency=0.0, jitter=0.0,
+                 filler_kb=20):
+        stub = self
+        self.total = total
+        self.per_page = per_page
+        self.latency = latency
+        self.jitter = jitter
+        self.filler_kb = filler_kb
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub._delay()
+                url = urlparse(self.path)
+                if url.path == "/find":
+                    page = int(parse_qs(url.query).get("page", ["1"])[0])
+                    body = search_html(page, stub.total, stub.per_page)
+                elif url.path.startswith("/listing/mitula-CO-"):
+                    listing_id = int(url.path.rsplit("-", 1)[1])
+                    body = listing_html(listing_id, stub.filler_kb)
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def _delay(self):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def wrap(self, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.samples.append(elapsed)
+        return timed
+
+    def percentile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+def _peak_rss_mb():
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _report(name, scale, pages, elapsed, latencies, bytes_transferred):
+    return {
+        "scenario": name,
+        "scale": scale,
+        "pages": pages,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(latencies.percentile(50) * 1000, 2),
+        "p99_ms": round(latencies.percentile(99) * 1000, 2),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "bytes": bytes_transferred,
+    }
+
+
+def run_parcial1(scale, latency=0.0, jitter=0.0, mode="threads",
+                 filler_kb=20):
+    """Ejecuta ``lambda_function.lambda_handler`` contra el servidor local."""
+    import lambda_function
+
+    s3 = FakeS3(sink_buckets={lambda_function.S3_BUCKET_HTML})
+    latencies = LatencyRecorder()
+    received = [0]
+    original_send = requests.Session.send
+
+    def send(session, request, **kwargs):
+        response = original_send(session, request, **kwargs)
+        received[0] += len(response.content)
+        return response
+
+    with MitulaStub(scale, latency=latency, jitter=jitter,
+                    filler_kb=filler_kb) as stub:
+        saved = {
+            name: getattr(lambda_function, name)
+            for name in ("s3_client", "BASE_URL", "MAX_LISTINGS",
+                         "MAX_SEARCH_PAGES", "CRAWLER_MODE",
+                         "HOST_MIN_INTERVAL")
+        }
+        lambda_function.s3_client = s3
+        lambda_function.BASE_URL = f"{stub.url}/find"
+        lambda_function.MAX_LISTINGS = scale
+        lambda_function.MAX_SEARCH_PAGES = scale // stub.per_page + 2
+        lambda_function.CRAWLER_MODE = mode
+        lambda_function.HOST_MIN_INTERVAL = 0.0
+        requests.Session.send = latencies.wrap(send)
+        try:
+            start = time.perf_counter()
+            lambda_function.lambda_handler({}, None)
+            elapsed = time.perf_counter() - start
+        finally:
+            requests.Session.send = original_send
+            for name, value in saved.items():
+                setattr(lambda_function, name, value)
+
+    pages = s3.calls.get("PutObject", 0)
+    return _report("parcial1", scale, pages, elapsed, latencies,
+                   received[0] + s3.bytes_in)
+
+
+def run_parcial2(scale, filler_kb=20):
+    """Backfill de ``lambda_csv.lambda_handler`` con ``scale`` HTMLs."""
+    import lambda_csv
+
+    s3 = FakeS3()
+    keys = [f"{DAY}/{DAY}-property-{i + 1}.html" for i in range(scale)]
+    s3.add_virtual(
+        lambda_csv.S3_BUCKET_HTML, keys,
+        lambda key: listing_html(int(key.rsplit("-", 1)[1][:-5]), filler_kb))
+    latencies = LatencyRecorder()
+    saved = (lambda_csv.s3_client, lambda_csv._read_and_parse)
+    lambda_csv.s3_client = s3
+    lambda_csv._read_and_parse = latencies.wrap(lambda_csv._read_and_parse)
+    try:
+        start = time.perf_counter()
+        lambda_csv.lambda_handler({"prefix": f"{DAY}/"}, None)
+        elapsed = time.perf_counter() - start
+    finally:
+        lambda_csv.s3_client, lambda_csv._read_and_parse = saved
+
+    return _report("parcial2", scale, len(latencies.samples), elapsed,
+                   latencies, s3.bytes_in + s3.bytes_out)
+
+
+SCENARIOS = {"parcial1": run_parcial1, "parcial2": run_parcial2}
+
+
+def run_isolated(name, scale, options):
+    """Corre un escenario en un subproceso y devuelve su reporte."""
+    cmd = [sys.executable, os.path.abspath(__file__), "--single", name,
+           str(scale), "--latency", str(options.latency),
+           "--jitter", str(options.jitter)]
+    output = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def compare(report, baseline):
+    """Lista de regresiones de ``report`` frente a ``baseline``."""
+    problems = []
+    if baseline["pages"] < MIN_PAGES_TO_COMPARE:
+        return problems
+    if report["pages_per_sec"] < baseline["pages_per_sec"] * (
+            1 - MAX_THROUGHPUT_DROP):
+        problems.append(
+            f"pages/s {report['pages_per_sec']} < "
+            f"baseline {baseline['pages_per_sec']}")
+    if report["p99_ms"] > baseline["p99_ms"] * (1 + MAX_P99_INCREASE):
+        problems.append(
+            f"p99 {report['p99_ms']} ms > baseline {baseline['p99_ms']} ms")
+    if report["peak_rss_mb"] > baseline["peak_rss_mb"] * (
+            1 + MAX_RSS_INCREASE):
+        problems.append(
+            f"RSS {report['peak_rss_mb']} MB > "
+            f"baseline {baseline['peak_rss_mb']} MB")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+",
+                        default=list(DEFAULT_SCALES))
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS),
+                        default=sorted(SCENARIOS))
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="latencia base por petición HTTP (s)")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="latencia aleatoria adicional máxima (s)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--baseline-file", default=BASELINES_FILE,
+                        help="archivo de baselines a leer y escribir")
+    parser.add_argument("--check", action="store_true",
+                        help="falla si hay regresiones frente al baseline")
+    parser.add_argument("--single", nargs=2, metavar=("SCENARIO", "SCALE"),
+                        help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+
+    if options.single:
+        name, scale = options.single[0], int(options.single[1])
+        kwargs = {}
+        if name == "parcial1":
+            kwargs = {"latency": options.latency, "jitter": options.jitter}
+        print(json.dumps(SCENARIOS[name](scale, **kwargs)))
+        return 0
+
+    baselines = {}
+    if os.path.exists(options.baseline_file):
+        with open(options.baseline_file) as f:
+            baselines = json.load(f)
+
+    failed = False
+    for name in options.scenarios:
+        for scale in options.scales:
+            report = run_isolated(name, scale, options)
+            key = f"{name}:{scale}"
+            problems = []
+            if key in baselines:
+                problems = compare(report, baselines[key])
+            status = "REGRESIÓN " + "; ".join(problems) if problems else "ok"
+            if key not in baselines and options.check:
+                # Sin baseline no se comparó nada: el gate no puede pasar
+                problems = ["sin baseline"]
+                status = (f"SIN BASELINE para {key} en "
+                          f"{options.baseline_file}")
+            print(json.dumps(report), status)
+            failed |= bool(problems)
+            if options.save_baseline:
+                baselines[key] = report
+
+    if options.save_baseline:
+        with open(options.baseline_file, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+    return 1 if failed and options.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
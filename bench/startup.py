@@ -0,0 +1,141 @@
+"""Informe de arranque en frío de los handlers.
+
+Para cada handler lanza un intérprete nuevo con ``-X importtime`` y mide:
+
+* el tiempo de importación del módulo y sus dependencias más pesadas;
+* el tiempo hasta el primer byte de trabajo: desde que arranca el proceso
+  hasta la primera llamada a S3 de ``lambda_handler``;
+* qué paquetes pesados (boto3, requests, bs4) hay cargados en ese momento.
+
+Uso::
+
+    python bench/startup.py
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HANDLERS = {
+    "lambda_function": os.path.join(ROOT, "Parcial1"),
+    "lambda_csv": os.path.join(ROOT, "Parcial2"),
+}
+# Presupuesto de importación (ms), sobrescribible con IMPORT_BUDGET_MS_<MÓDULO>
+IMPORT_BUDGET_MS = {
+    "lambda_function": 300,
+    "lambda_csv": 150,
+}
+HEAVY_MODULES = ("boto3", "botocore.client", "requests", "bs4")
+
+# Evento mínimo con el que cada handler empieza a trabajar
+EVENTS = {
+    "lambda_function": {},
+    "lambda_csv": {"Records": [{"s3": {"object": {
+        "key": "2025-01-01/2025-01-01-property-1.html", "eTag": "x"}}}]},
+}
+
+# Se ejecuta en el intérprete hijo: sustituye s3_client por un stub que
+# anota la hora de la primera llamada y corta la invocación.
+_CHILD = """
+import json, sys, time
+import {module} as handler
+
+class _Stop(Exception):
+    pass
+
+class _FirstCall:
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            first = time.time()
+            loaded = [m for m in {heavy!r} if m in sys.modules]
+            print(json.dumps({{"first_byte": first, "loaded": loaded}}))
+            raise _Stop
+        return call
+
+handler.s3_client = _FirstCall()
+if hasattr(handler, "requests"):
+    # Parcial1 haría peticiones reales antes de tocar S3
+    handler.get_property_links = lambda *a, **k: ["http://127.0.0.1/x"]
+    handler.requests.get = lambda *a, **k: type(
+        "R", (), {{"text": "", "content": b"", "status_code": 200,
+                  "headers": {{}}, "raise_for_status": lambda self: None}})()
+try:
+    handler.lambda_handler({event!r}, None)
+except _Stop:
+    pass
+"""
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def import_budget_ms(module):
+    env = os.environ.get(f"IMPORT_BUDGET_MS_{module.upper()}")
+    return float(env) if env else IMPORT_BUDGET_MS[module]
+
+
+def _env(path):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [path] + [p for p in [env.get("PYTHONPATH")] if p])
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    env["METRICS_ENABLED"] = "0"
+    return env
+
+
+def measure_import(module):
+    """``(total_ms, [(cumulativo_ms, paquete), ...])`` de ``import module``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=_env(HANDLERS[module]), capture_output=True, text=True,
+        check=True)
+    # La salida va en postorden: las dependencias directas del módulo son
+    # las del segundo nivel que aparecen desde el import anterior de primer
+    # nivel (lo que importa el propio intérprete, p. ej. vía .pth, no cuenta)
+    block = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if not match:
+            continue
+        cumulative_ms = int(match.group(2)) / 1000
+        indent, name = len(match.group(3)), match.group(4)
+        if indent == 1:
+            if name == module:
+                direct = sorted(block, reverse=True)
+                return cumulative_ms, direct
+            block = []
+        elif indent == 3:
+            block.append((cumulative_ms, name))
+    raise RuntimeError(f"{module} no aparece en la salida de -X importtime")
+
+
+def measure_first_byte(module):
+    """Segundos desde lanzar el intérprete hasta la primera llamada a S3."""
+    code = _CHILD.format(module=module, heavy=HEAVY_MODULES,
+                         event=EVENTS[module])
+    start = time.time()
+    result = subprocess.run(
+        [sys.executable, "-c", code], env=_env(HANDLERS[module]),
+        capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report["first_byte"] - start, report["loaded"]
+
+
+def main():
+    for module in HANDLERS:
+        total, direct = measure_import(module)
+        first_byte, loaded = measure_first_byte(module)
+        budget = import_budget_ms(module)
+        print(f"== {module}: import {total:.1f} ms (presupuesto {budget} ms),"
+              f" primer byte de trabajo {first_byte * 1000:.1f} ms")
+        print(f"   cargados al primer byte: {', '.join(loaded) or '-'}")
+        for ms, name in direct[:8]:
+            print(f"   {ms:8.1f} ms  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+from harness import run_parcial1, run_parcial2
+
+
+def test_benchmark_offline_parcial1():
+    """Prueba que el escenario de Parcial1 corre sin red externa ni AWS."""
+    report = run_parcial1(10, jitter=0.002, filler_kb=1)
+    assert report["pages"] == 10
+    assert report["bytes"] > 0
+    assert report["p50_ms"] <= report["p99_ms"]
+
+
+def test_benchmark_offline_parcial2():
+    """Prueba que el escenario de Parcial2 procesa todos los HTMLs."""
+    report = run_parcial2(10, filler_kb=1)
+    assert report["pages"] == 10
+    assert report["pages_per_sec"] > 0
@@ -0,0 +1,29 @@
+import subprocess
+import sys
+
+import pytest
+
+from startup import HANDLERS, _env, import_budget_ms, measure_import
+
+
+@pytest.mark.parametrize("module", sorted(HANDLERS))
+def test_import_dentro_del_presupuesto(module):
+    """Falla si importar el handler supera su presupuesto de arranque."""
+    total_ms, direct = measure_import(module)
+    assert total_ms <= import_budget_ms(module), direct[:5]
+
+
+def test_parser_no_carga_dependencias_pesadas():
+    """El parseo de Parcial2 no importa requests, bs4 ni boto3."""
+    code = (
+        "import sys, lambda_csv\n"
+        "html = '<div id=\"view-map__text\">x</div>"
+        "<div class=\"prices-and-fees__price\">1</div>'"
+        " + '<div class=\"details-item-value\">1</div>' * 3\n"
+        "lambda_csv.extract_from_html(html, 'fast')\n"
+        "print([m for m in ('requests', 'bs4', 'boto3') if m in sys.modules])"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], env=_env(HANDLERS["lambda_csv"]),
+        capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"